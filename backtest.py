@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+BACKTEST - LZ TRADING BOT
+Rejoue des bougies M1/M15 locales dans la logique du bot
+(ZoneTracker, Patterns.scan, regles de _check_signal) sans websocket.
+"""
+
+import argparse
+import glob
+import heapq
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from bot import (CONFIG, RECORD, Candle, CandleSeries, Patterns, Stats,
+                 Trade, TradingBot, log)
+
+# ============================================================
+#                  DONNEES
+# ============================================================
+
+# Un fichier par symbole et granularite : <dossier>/<SYMBOLE>_<granularite>
+# .csv : epoch,open,high,low,close (en-tete facultatif)
+# .bin : enregistrements float64 (epoch, open, high, low, close)
+# ou, a defaut, les fichiers journaliers du Recorder du bot :
+# <SYMBOLE>_<granularite>_<AAAAMMJJ>.bin
+
+def map_records(path):
+    # Vue (n, 5) en memmap, sans copie ni analyse ; un enregistrement
+    # incomplet en fin de fichier est ignore
+    n = os.path.getsize(path) // RECORD.size
+    if n == 0:
+        return np.empty((0, 5))
+    return np.memmap(path, dtype=np.float64, mode="r", shape=(n, 5))
+
+def load_candles(path):
+    # path : un fichier ou une liste de fichiers journaliers .bin
+    if isinstance(path, list):
+        parts = [map_records(p) for p in path]
+        data = parts[0] if len(parts) == 1 else np.concatenate(parts)
+    elif path.endswith(".bin"):
+        data = map_records(path)
+    else:
+        with open(path) as f:
+            first = f.readline()
+        skip = 0 if first[:1].isdigit() else 1
+        data = np.loadtxt(path, delimiter=",", skiprows=skip, ndmin=2)[:, :5]
+    if len(data) > 1 and not (data[1:, 0] >= data[:-1, 0]).all():
+        data = data[np.argsort(data[:, 0], kind="stable")]
+    # Une seule version par bougie : la derniere
+    keep = np.r_[data[1:, 0] != data[:-1, 0], True]
+    if len(data) and not keep.all():
+        data = data[keep]
+    return (data[:, 1], data[:, 2], data[:, 3], data[:, 4],
+            data[:, 0].astype(np.int64))
+
+def resample(arrays, gran):
+    # Agrege des bougies en bougies de `gran` secondes
+    o, h, l, c, t = arrays
+    if len(t) == 0:
+        return arrays
+    b = t // gran * gran
+    start = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    end = np.r_[start[1:], len(t)] - 1
+    return (o[start], np.maximum.reduceat(h, start),
+            np.minimum.reduceat(l, start), c[end], b[start])
+
+def _find(directory, sym, gran):
+    for ext in (".bin", ".csv"):
+        path = os.path.join(directory, f"{sym}_{gran}{ext}")
+        if os.path.exists(path):
+            return path
+    days = sorted(glob.glob(os.path.join(directory, f"{sym}_{gran}_[0-9]*.bin")))
+    return days or None
+
+def _between(arrays, start, end):
+    t = arrays[4]
+    sel = (t >= start) & (t < end)
+    return tuple(x[sel] for x in arrays)
+
+def load_data(directory, symbols, start=0, end=2**62):
+    # {symbole: (M1, M15)} ; M15 reconstruit depuis M1 si absent.
+    # Les M15 demarrent m15_bars plus tot pour chauffer les zones.
+    data = {}
+    for sym in symbols:
+        path = _find(directory, sym, 60)
+        if path is None:
+            log.warning("%s : pas de donnees M1 dans %s", sym, directory)
+            continue
+        m1 = load_candles(path)
+        path = _find(directory, sym, 900)
+        m15 = load_candles(path) if path else resample(m1, 900)
+        data[sym] = (_between(m1, start, end),
+                     _between(m15, start - CONFIG["m15_bars"] * 900, end))
+    return data
+
+def prepare(data):
+    # Artefacts qui ne dependent d'aucun parametre de strategie
+    prepared = {}
+    for sym, (m1, m15) in data.items():
+        series = CandleSeries(*m1)
+        masks = Patterns.masks(series.no, series.nh, series.nl, series.nc)
+        prepared[sym] = {"m1": series, "m15": m15, "masks": masks}
+    return prepared
+
+# ============================================================
+#                  MOTEUR
+# ============================================================
+
+class Backtest(TradingBot):
+    # Le bot lui-meme, avec l'horloge des bougies et un reglement local des
+    # options a l'expiration. Seules les bougies M1 portant un pattern
+    # (masques precalcules) passent par _check_signal : sur les autres,
+    # scan() ne peut rien donner et aucune regle ne change d'etat.
+    # Zones calculees sur place : l'horloge des bougies ne doit pas attendre
+    # un worker.
+
+    ZONE_THREADS = False
+
+    def __init__(self, prepared):
+        super().__init__(stats=Stats(path=None))
+        self.notify = False
+        self.cache  = None
+        self.recorder = None
+        self.zstore = None
+        self.data   = {s: d for s, d in prepared.items() if s in self.symbols}
+        self.clock  = 0
+        self.expiring = []      # tas (heure d'expiration, n, trade)
+        self._seq = 0
+
+    def _now(self):
+        return self.clock
+
+    def _trade(self, sym, ctype, price, pattern):
+        expiry = CONFIG["instruments"][sym]["expiry"]
+        trade = Trade(self.clock, ctype, sym, price, CONFIG["stake"], expiry)
+        trade.pattern = pattern
+        self.daily_trades += 1
+        self._seq += 1
+        heapq.heappush(self.expiring, (self.clock + expiry * 60, self._seq, trade))
+
+    def _settle(self, until):
+        while self.expiring and self.expiring[0][0] < until:
+            end, _, trade = heapq.heappop(self.expiring)
+            m1 = self.data[trade.symbol]["m1"]
+            # Prix de sortie : cloture de la M1 qui se termine a l'expiration
+            j = int(np.searchsorted(m1.nt, end - 60, side="right")) - 1
+            trade.exit_price = m1.c[j]
+            if trade.direction == "CALL":
+                trade.is_win = trade.exit_price > trade.entry_price
+            else:
+                trade.is_win = trade.exit_price < trade.entry_price
+            trade.profit = (trade.stake * CONFIG["payout"] / 100
+                            if trade.is_win else -trade.stake)
+            trade.result_time = end
+            self.stats.add(trade)
+            self.daily_profit += trade.profit
+
+    def _events(self):
+        # (heure, type, symbole, indice) ; type 0 = ouverture M15,
+        # type 1 = arrivee de la M1 suivante (la bougie indice est cloturee)
+        use_doji = CONFIG["use_doji"]
+        parts = []
+        for k, (sym, d) in enumerate(self.data.items()):
+            t15 = d["m15"][4]
+            parts.append((t15, np.zeros(len(t15), np.int8),
+                          np.full(len(t15), k), np.arange(len(t15))))
+            m = d["masks"]
+            hit = ((Patterns.first(m, 1, use_doji) >= 0) |
+                   (Patterns.first(m, -1, use_doji) >= 0))
+            hit[:50] = False        # M1 pret a partir de 50 bougies
+            hit[-1:] = False        # la suivante n'arrive jamais
+            j = np.flatnonzero(hit)
+            t1 = d["m1"].nt
+            parts.append((t1[j + 1], np.ones(len(j), np.int8),
+                          np.full(len(j), k), j))
+        if not parts:
+            return []
+        t, kind, sym, idx = (np.concatenate(x) for x in zip(*parts))
+        order = np.lexsort((idx, sym, kind, t))
+        return zip(t[order].tolist(), kind[order].tolist(),
+                   sym[order].tolist(), idx[order].tolist())
+
+    def run(self):
+        syms = list(self.data)
+        for sym in syms:
+            self.m15_ok[sym] = True
+            self.m1_ok[sym]  = True
+        first = True
+        for t, kind, k, i in self._events():
+            if first:
+                self.last_day = datetime.fromtimestamp(t).day
+                first = False
+            self._settle(t)
+            self.clock = t
+            sym = syms[k]
+            d = self.data[sym]
+            if kind == 0:
+                o, h, l, c, tt = d["m15"]
+                buf = self.m15[sym]
+                if not buf:
+                    buf.append(Candle(o[i], o[i], o[i], o[i], int(tt[i])))
+                    continue
+                # Bougie precedente finale, puis ouverture de la nouvelle
+                self._m15_bar(sym, Candle(o[i-1], h[i-1], l[i-1], c[i-1], int(tt[i-1])))
+                self._m15_bar(sym, Candle(o[i], o[i], o[i], o[i], int(tt[i])))
+            else:
+                self.m1[sym] = d["m1"][max(0, i + 2 - 500):i + 2]
+                self._check_signal(sym)
+        self._settle(2**62)
+        return self.report()
+
+    def report(self):
+        out = {"total": self.stats.total()}
+        for sym in self.data:
+            out[sym] = self.stats.total(sym)
+        return out
+
+def run_backtest(prepared, overrides=None):
+    # Applique des valeurs de CONFIG le temps d'un backtest
+    saved = {k: CONFIG[k] for k in (overrides or {})}
+    CONFIG.update(overrides or {})
+    try:
+        return Backtest(prepared).run()
+    finally:
+        CONFIG.update(saved)
+
+# ============================================================
+#                  LANCEMENT
+# ============================================================
+
+def _date(s):
+    return int(datetime.strptime(s, "%Y-%m-%d").timestamp())
+
+def _line(label, s):
+    return (f"{label:<14} W:{s['wins']} L:{s['losses']} | "
+            f"WR: {s['winrate']:.1f}% | Profit: {s['profit']:.2f}$ | "
+            f"MaxW:{s['max_w']} MaxL:{s['max_l']}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Backtest LZ Trading Bot")
+    ap.add_argument("--data", default="data", help="dossier des bougies")
+    ap.add_argument("--start", type=_date, default=0, help="AAAA-MM-JJ")
+    ap.add_argument("--end", type=_date, default=2**62, help="AAAA-MM-JJ")
+    ap.add_argument("--verbose", action="store_true", help="log des signaux")
+    args = ap.parse_args()
+
+    CONFIG["telegram_enabled"] = False
+    t0 = time.perf_counter()
+    data = load_data(args.data, list(CONFIG["instruments"]), args.start, args.end)
+    prepared = prepare(data)
+    t1 = time.perf_counter()
+    if not args.verbose:
+        log.setLevel(logging.WARNING)
+    res = run_backtest(prepared)
+    t2 = time.perf_counter()
+    log.setLevel(logging.INFO)
+
+    bars = sum(len(d["m1"]) for d in prepared.values())
+    log.info("%d bougies M1 | chargement %.1fs | backtest %.1fs", bars, t1 - t0, t2 - t1)
+    log.info(_line("TOTAL", res["total"]))
+    for sym in prepared:
+        log.info(_line(CONFIG["instruments"][sym]["name"], res[sym]))
+
+if __name__ == "__main__":
+    main()
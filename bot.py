@@ -5,14 +5,23 @@ Zones M15 + Patterns M1
 Touches: 10 | Railway Edition
 """
 
-import websocket
+import asyncio
+import websockets
 import json
 import time
 import requests
 import logging
 import os
+import threading
+import functools
+import struct
+import numpy as np
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 from collections import deque
+from numpy.lib.stride_tricks import sliding_window_view
 
 # ============================================================
 #                  CONFIGURATION
@@ -21,9 +30,11 @@ from collections import deque
 CONFIG = {
     "deriv_token"      : os.getenv("DERIV_TOKEN", ""),
     "deriv_app_id"     : os.getenv("DERIV_APP_ID", ""),
+    "deriv_url"        : os.getenv("DERIV_URL", "wss://ws.binaryws.com/websockets/v3"),
     "telegram_token"   : os.getenv("TELEGRAM_TOKEN", ""),
     "telegram_chat_id" : os.getenv("TELEGRAM_CHAT_ID", ""),
     "telegram_enabled" : True,
+    "telegram_queue"   : 50,       # messages en attente max (au-dela : rapports stats fusionnes/abandonnes)
 
     # Expiration fixée à 5 min pour tous les actifs
     "instruments": {
@@ -39,10 +50,76 @@ CONFIG = {
     "zz_depth"           : 12,
     "zz_deviation"       : 5,
     "zz_backstep"        : 3,
+    "zone_engine"        : "numpy",  # "numpy" (vectorise) ou "python"
     "max_touches"        : 10,
     "m15_bars"           : 2880,
+    # Jeux de zones par granularite (multiples de 900, H1/H4 agreges
+    # depuis les M15), dans l'ordre de recherche : la premiere granularite
+    # dont une zone est touchee l'emporte. Ex. (14400, 3600, 900).
+    "zone_timeframes"    : (900,),
     "max_trades_per_day" : 60,
     "daily_stop_loss"    : -15.0,
+
+    # Historique des trades (journal en ajout seul + snapshot)
+    "stats_file"         : "bot_stats.jsonl",
+    "journal_sync_every" : 10,     # fsync tous les N trades...
+    "journal_sync_secs"  : 5.0,    # ...ou toutes les N secondes
+    "journal_compact"    : 1000,   # lignes de journal avant compaction
+
+    # Enregistrement des bougies recues (vide = desactive)
+    "record_dir"         : os.getenv("RECORD_DIR", ""),
+    # Cache disque des bougies : seul le trou est redemande (vide = desactive)
+    "cache_dir"          : os.getenv("CACHE_DIR", "cache"),
+    # Bougies construites localement depuis un seul flux de ticks par
+    # symbole (False : flux ohlc M1 et M15 du serveur). Toutes les
+    # granularites listees sont construites ; 60 et 900 alimentent M1/M15.
+    "tick_bars"          : True,
+    "timeframes"         : (60, 900),
+
+    # Snapshot des zones et touches, repris au demarrage (vide = desactive)
+    "zone_file"          : os.getenv("ZONE_FILE", "zones.json"),
+
+    # File de reception (messages en attente de traitement)
+    "inbox_size"         : 2000,   # au-dela : la lecture du websocket attend
+    "inbox_report"       : 600,    # secondes entre deux bilans dans le log
+
+    # Cloture M1 a la minute (heure serveur) + delai de grace, sans attendre
+    # le premier ohlc de la bougie suivante
+    "close_timer"        : True,
+    "close_grace"        : 0.25,   # secondes
+
+    # Proposition pre-abonnee tant que la derniere M1 close est dans une
+    # zone : achat par id de proposition, sans tarification a l'achat
+    "prearm"             : True,
+    "proposal_max_age"   : 2.0,    # secondes sans mise a jour : achat direct
+
+    # Envois par classe (priorite decroissante : buy, contract, forget,
+    # history) : (requetes par minute, rafale). Limites de l'API Deriv :
+    # achats 100/min, tarification 80/min, general 180/min.
+    "rate_limits"        : {
+        "buy"      : (100, 10),
+        "contract" : (80, 10),
+        "forget"   : (180, 20),
+        "history"  : (180, 20),
+    },
+
+    # Suivi des trades
+    "request_timeout"    : 15.0,   # secondes sans reponse : requete abandonnee
+    "max_inflight"       : 20,     # achats en attente + contrats ouverts (au-dela : pas de signal)
+    "settle_grace"       : 60,     # secondes apres l'expiration sans resultat : bilan portfolio/profit_table
+
+    # Reglement local des contrats sur le flux de prix deja recu (M1), sans
+    # abonnement par contrat : resultat provisoire a l'expiration, resultat
+    # officiel par un bilan groupe (False : proposal_open_contract par contrat)
+    "local_settle"       : False,
+    "settle_confirm"     : 2.0,    # secondes apres une expiration locale avant le bilan
+
+    # Metriques (histogrammes de durees, compteurs) : resume dans le log
+    # tous les inbox_report secondes, format Prometheus sur
+    # http://metrics_host:metrics_port/metrics (port 0 = pas d'endpoint)
+    "metrics"            : True,
+    "metrics_host"       : os.getenv("METRICS_HOST", "127.0.0.1"),
+    "metrics_port"       : int(os.getenv("METRICS_PORT", "0")),
 }
 
 # ============================================================
@@ -55,31 +132,281 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 log = logging.getLogger(__name__)
+logging.getLogger("websockets").setLevel(logging.WARNING)
+
+# ============================================================
+#                  METRIQUES
+# ============================================================
+
+class Histogram:
+    # Durees (secondes) par tranche, cumulables facon Prometheus, plus
+    # somme, nombre et max. observe() : un bisect et trois additions.
+    BOUNDS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3,
+              5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    __slots__ = ("counts", "sum", "count", "max", "lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)     # derniere : +Inf
+        self.sum    = 0.0
+        self.count  = 0
+        self.max    = 0.0
+        self.lock   = threading.Lock()  # observe() depuis les threads de zones
+
+    def observe(self, value):
+        i = bisect_left(self.BOUNDS, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        # Borne haute de la tranche du quantile (au plus le max)
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return 0.0
+
+class Metrics:
+    # Histogrammes et compteurs par (nom, valeur d'etiquette). Inactif
+    # (observe/inc sans effet) tant que TradingBot.run() ne l'a pas active :
+    # le backtest n'en paie que l'appel.
+    HELP = {
+        "lz_decode_seconds"       : ("msg_type", "Decodage JSON d'une trame"),
+        "lz_handle_seconds"       : ("msg_type", "Traitement d'un message (_on_msg)"),
+        "lz_zones_seconds"        : ("op", "Calcul des zones (compute, reset, update)"),
+        "lz_find_zone_seconds"    : ("", "Recherche de la zone touchee par une M1"),
+        "lz_scan_seconds"         : ("", "Patterns.scan"),
+        "lz_close_to_buy_seconds" : ("via", "Cloture M1 -> achat envoye"),
+        "lz_buy_ack_seconds"      : ("via", "Achat envoye -> reponse"),
+        "lz_signal_to_ack_seconds": ("via", "Signal -> reponse achat"),
+        "lz_send_wait_seconds"    : ("class", "Attente en file d'envoi, par classe"),
+        "lz_zone_lag_seconds"     : ("zones", "Age des zones servies a un controle de signal"),
+        "lz_telegram_seconds"     : ("stage", "telegram() (call) et envoi HTTP (post)"),
+        "lz_signals_total"        : ("symbol", "Signaux"),
+        "lz_buys_total"           : ("result", "Achats par issue"),
+        "lz_api_errors_total"     : ("msg_type", "Erreurs API hors requetes"),
+        "lz_inbox_received_total" : ("", "Messages recus"),
+        "lz_inbox_coalesced_total": ("", "Mises a jour ohlc fusionnees"),
+        "lz_inbox_depth"          : ("", "Messages en attente de traitement"),
+        "lz_inbox_depth_max"      : ("", "File de reception : profondeur max"),
+        "lz_send_pending"         : ("", "Messages en file d'envoi"),
+    }
+
+    def __init__(self):
+        self.on       = False
+        self.hists    = {}      # (nom, etiquette) -> Histogram
+        self.counters = {}      # (nom, etiquette) -> int
+        self.gauges   = {}      # (nom, etiquette) -> valeur
+
+    def observe(self, name, value, label=""):
+        if not self.on:
+            return
+        h = self.hists.get((name, label))
+        if h is None:
+            h = self.hists.setdefault((name, label), Histogram())
+        h.observe(value)
+
+    def inc(self, name, label="", n=1):
+        if self.on:
+            key = (name, label)
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def set(self, name, value, label=""):
+        if self.on:
+            self.gauges[(name, label)] = value
+
+    def peak(self, name, value, label=""):
+        # Jauge du maximum atteint
+        if self.on and value > self.gauges.get((name, label), 0):
+            self.gauges[(name, label)] = value
+
+    def _labels(self, name, label, extra=""):
+        key = self.HELP.get(name, ("",))[0]
+        parts = [f'{key}="{label}"'] if key and label else []
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self):
+        # Format texte Prometheus 0.0.4
+        out = []
+        for name in sorted({n for n, _ in self.hists}):
+            out.append(f"# HELP {name} {self.HELP.get(name, ('', name))[1]}")
+            out.append(f"# TYPE {name} histogram")
+            for (n, label), h in sorted(self.hists.items()):
+                if n != name:
+                    continue
+                with h.lock:
+                    counts, total, count = list(h.counts), h.sum, h.count
+                seen = 0
+                for bound, k in zip(Histogram.BOUNDS + ("+Inf",), counts):
+                    seen += k
+                    le = 'le="%s"' % bound
+                    out.append(f"{name}_bucket{self._labels(name, label, le)} {seen}")
+                out.append(f"{name}_sum{self._labels(name, label)} {total}")
+                out.append(f"{name}_count{self._labels(name, label)} {count}")
+        for name in sorted({n for n, _ in self.counters}):
+            out.append(f"# HELP {name} {self.HELP.get(name, ('', name))[1]}")
+            out.append(f"# TYPE {name} counter")
+            for (n, label), v in sorted(self.counters.items()):
+                if n == name:
+                    out.append(f"{name}{self._labels(name, label)} {v}")
+        for name in sorted({n for n, _ in self.gauges}):
+            out.append(f"# HELP {name} {self.HELP.get(name, ('', name))[1]}")
+            out.append(f"# TYPE {name} gauge")
+            for (n, label), v in sorted(self.gauges.items()):
+                if n == name:
+                    out.append(f"{name}{self._labels(name, label)} {v}")
+        return "\n".join(out) + "\n"
+
+    def summary(self):
+        # Une ligne par histogramme : nombre, p50/p99 (bornes de tranche), max
+        lines = []
+        for (name, label), h in sorted(self.hists.items()):
+            if h.count:
+                lines.append(f"{name[3:-8]}{'[' + label + ']' if label else ''} "
+                             f"n={h.count} p50<={h.quantile(0.5) * 1e6:.0f}us "
+                             f"p99<={h.quantile(0.99) * 1e6:.0f}us "
+                             f"max={h.max * 1e6:.0f}us")
+        if self.counters:
+            lines.append(" ".join(f"{name[3:-6]}{'[' + label + ']' if label else ''}={v}"
+                                  for (name, label), v in sorted(self.counters.items())))
+        if self.gauges:
+            lines.append(" ".join(f"{name[3:]}{'[' + label + ']' if label else ''}={v}"
+                                  for (name, label), v in sorted(self.gauges.items())))
+        return lines
+
+METRICS = Metrics()
+
+def timed(name, label=""):
+    # Duree de chaque appel dans l'histogramme name{label}
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                METRICS.observe(name, time.perf_counter() - t0, label)
+        return inner
+    return wrap
 
 # ============================================================
 #                  TELEGRAM
 # ============================================================
 
-def telegram(message):
+class Notifier:
+    # Envoi Telegram en arriere-plan : les callbacks websocket ne font
+    # qu'empiler le message dans une file bornee, un thread l'envoie avec
+    # une session HTTP persistante. Les rafales sont regroupees en un seul
+    # message ; un rapport de stats (low) en attente est remplace par le
+    # suivant, et seul abandonne si la file est pleine : signaux et
+    # resultats ne sont jamais perdus (la file depasse alors sa taille).
+
+    MAX_LEN   = 4000    # limite Telegram : 4096 caracteres
+    RETRIES   = 5
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.queue   = deque()          # (texte, low)
+        self.cond    = threading.Condition()
+        self.session = requests.Session()
+        self.thread  = None
+        self.dropped = 0
+
+    def send(self, message, low=False):
+        with self.cond:
+            if low:
+                for i, (_, was_low) in enumerate(self.queue):
+                    if was_low:
+                        del self.queue[i]
+                        break
+            if len(self.queue) >= self.maxsize:
+                drop = next((i for i, (_, l) in enumerate(self.queue) if l), None)
+                if drop is not None:
+                    del self.queue[drop]
+                if drop is not None or low:
+                    self.dropped += 1
+                    log.warning("Telegram: file pleine, rapport abandonne (%d)", self.dropped)
+                if drop is None and low:
+                    return
+            self.queue.append((message, low))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._worker, name="telegram",
+                                               daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def _next(self):
+        # Regroupe les messages en attente, dans l'ordre, sous la limite
+        with self.cond:
+            while not self.queue:
+                self.cond.wait()
+            parts = [self.queue.popleft()[0]]
+            size = len(parts[0])
+            while self.queue and size + len(self.queue[0][0]) + 2 <= self.MAX_LEN:
+                text = self.queue.popleft()[0]
+                parts.append(text)
+                size += len(text) + 2
+            return "\n\n".join(parts)
+
+    def _worker(self):
+        while True:
+            self._post(self._next())
+
+    @timed("lz_telegram_seconds", "post")
+    def _post(self, text):
+        url = f"https://api.telegram.org/bot{CONFIG['telegram_token']}/sendMessage"
+        delay = 1
+        for attempt in range(self.RETRIES):
+            try:
+                r = self.session.post(url, json={
+                    "chat_id": CONFIG["telegram_chat_id"],
+                    "text": text,
+                    "parse_mode": "HTML"
+                }, timeout=10)
+                if r.status_code == 429:
+                    try:
+                        wait = r.json()["parameters"]["retry_after"]
+                    except Exception:
+                        wait = delay
+                    log.warning("Telegram: limite atteinte, pause %ss", wait)
+                    time.sleep(wait)
+                    continue
+                if r.status_code < 500:
+                    if r.status_code != 200:
+                        log.error("Telegram error: %s %s", r.status_code, r.text[:200])
+                    return
+                log.error("Telegram error: HTTP %s", r.status_code)
+            except Exception as e:
+                log.error("Telegram error: %s", e)
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+        log.error("Telegram: message abandonne apres %d essais", self.RETRIES)
+
+_notifier = Notifier(CONFIG["telegram_queue"])
+
+@timed("lz_telegram_seconds", "call")
+def telegram(message, low=False):
+    # low=True : rapport de stats, fusionnable/abandonnable sous charge
     if not CONFIG["telegram_enabled"]:
         return
     if not CONFIG["telegram_token"]:
         return
-    try:
-        url = f"https://api.telegram.org/bot{CONFIG['telegram_token']}/sendMessage"
-        requests.post(url, json={
-            "chat_id": CONFIG["telegram_chat_id"],
-            "text": message,
-            "parse_mode": "HTML"
-        }, timeout=10)
-    except Exception as e:
-        log.error("Telegram error: %s", e)
+    _notifier.send(message, low)
 
 # ============================================================
 #                  STRUCTURES
 # ============================================================
 
 class Candle:
+    __slots__ = ("open", "high", "low", "close", "time")
+
     def __init__(self, o, h, l, c, t):
         self.open  = o
         self.high  = h
@@ -87,6 +414,188 @@ class Candle:
         self.close = c
         self.time  = t
 
+    # Forme de la bougie (corps, etendue, meches)
+    @property
+    def body(self): return abs(self.close - self.open)
+    @property
+    def rng(self):  return self.high - self.low
+    @property
+    def uw(self):   return self.high - max(self.open, self.close)
+    @property
+    def lw(self):   return min(self.open, self.close) - self.low
+
+def candle_features(o, h, l, c):
+    # body, rng, uw, lw en vectorise (memes formules que Candle)
+    return (np.abs(c - o), h - l, h - np.maximum(o, c), np.minimum(o, c) - l)
+
+class CandleView:
+    # Bougie lue directement dans les colonnes d'un CandleBuffer
+    __slots__ = ("buf", "i")
+
+    def __init__(self, buf, i):
+        self.buf = buf
+        self.i   = i
+
+    @property
+    def open(self):  return self.buf.o[self.i]
+    @property
+    def high(self):  return self.buf.h[self.i]
+    @property
+    def low(self):   return self.buf.l[self.i]
+    @property
+    def close(self): return self.buf.c[self.i]
+    @property
+    def time(self):  return self.buf.t[self.i]
+    @property
+    def body(self):  return self.buf.fb[self.i]
+    @property
+    def rng(self):   return self.buf.fr[self.i]
+    @property
+    def uw(self):    return self.buf.fu[self.i]
+    @property
+    def lw(self):    return self.buf.fl[self.i]
+
+class CandleWindow:
+    # Tranche de bougies consecutives d'un CandleBuffer, sans copie
+    __slots__ = ("buf", "start", "n")
+
+    def __init__(self, buf, start, n):
+        self.buf   = buf
+        self.start = start
+        self.n     = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            a, b, step = i.indices(self.n)
+            if step != 1:
+                raise ValueError("pas de tranche avec pas")
+            return CandleWindow(self.buf, self.start + a, max(0, b - a))
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("candle index out of range")
+        return CandleView(self.buf, self.start + i)
+
+    def __iter__(self):
+        for i in range(self.start, self.start + self.n):
+            yield CandleView(self.buf, i)
+
+    def arrays(self):
+        a, b = self.start, self.start + self.n
+        buf = self.buf
+        return buf.no[a:b], buf.nh[a:b], buf.nl[a:b], buf.nc[a:b], buf.nt[a:b]
+
+    def copy(self):
+        # Copie figee (CandleSeries), lisible depuis un autre thread
+        return CandleSeries(*(x.copy() for x in self.arrays()))
+
+class CandleBuffer(CandleWindow):
+    # Buffer circulaire de taille fixe, colonnes open/high/low/close/time
+    # contigues. Chaque bougie est ecrite deux fois (slot et slot+maxlen) :
+    # les n dernieres bougies forment toujours une tranche contigue, ce qui
+    # donne des fenetres et des vues NumPy sans copie.
+    # Une vue reste valide tant que sa bougie n'est pas sortie du buffer.
+    # La forme (fb/fr/fu/fl = body/rng/uw/lw) est calculee une fois, a la
+    # cloture de la bougie (ajout de la suivante ou seal_last()).
+    __slots__ = ("maxlen", "pos", "o", "h", "l", "c", "t",
+                 "fb", "fr", "fu", "fl",
+                 "no", "nh", "nl", "nc", "nt")
+
+    def __init__(self, maxlen):
+        size = 2 * maxlen
+        self.maxlen = maxlen
+        self.pos = 0
+        self.o = array("d", bytes(8 * size))
+        self.h = array("d", bytes(8 * size))
+        self.l = array("d", bytes(8 * size))
+        self.c = array("d", bytes(8 * size))
+        self.t = array("q", bytes(8 * size))
+        self.fb = array("d", bytes(8 * size))
+        self.fr = array("d", bytes(8 * size))
+        self.fu = array("d", bytes(8 * size))
+        self.fl = array("d", bytes(8 * size))
+        self.no = np.frombuffer(self.o, dtype=np.float64)
+        self.nh = np.frombuffer(self.h, dtype=np.float64)
+        self.nl = np.frombuffer(self.l, dtype=np.float64)
+        self.nc = np.frombuffer(self.c, dtype=np.float64)
+        self.nt = np.frombuffer(self.t, dtype=np.int64)
+        super().__init__(self, maxlen, 0)
+
+    def append(self, candle):
+        self.append_bar(candle.open, candle.high, candle.low,
+                        candle.close, candle.time)
+
+    def append_bar(self, o, h, l, c, t):
+        if self.n:
+            self.seal_last()
+        p = self.pos
+        q = p + self.maxlen
+        self.o[p] = self.o[q] = o
+        self.h[p] = self.h[q] = h
+        self.l[p] = self.l[q] = l
+        self.c[p] = self.c[q] = c
+        self.t[p] = self.t[q] = t
+        self.pos = (p + 1) % self.maxlen
+        if self.n < self.maxlen:
+            self.n += 1
+        self.start = self.pos + self.maxlen - self.n
+
+    def __setitem__(self, i, candle):
+        # Remplacement en place (mise a jour de la bougie en cours)
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("candle index out of range")
+        q = self.start + i
+        p = q - self.maxlen if q >= self.maxlen else q + self.maxlen
+        self.o[p] = self.o[q] = candle.open
+        self.h[p] = self.h[q] = candle.high
+        self.l[p] = self.l[q] = candle.low
+        self.c[p] = self.c[q] = candle.close
+        self.t[p] = self.t[q] = candle.time
+        if i < self.n - 1:
+            self._seal(q)
+
+    def seal_last(self):
+        self._seal(self.start + self.n - 1)
+
+    def _seal(self, q):
+        p = q - self.maxlen if q >= self.maxlen else q + self.maxlen
+        o, h, l, c = self.o[q], self.h[q], self.l[q], self.c[q]
+        self.fb[p] = self.fb[q] = abs(c - o)
+        self.fr[p] = self.fr[q] = h - l
+        self.fu[p] = self.fu[q] = h - max(o, c)
+        self.fl[p] = self.fl[q] = min(o, c) - l
+
+    def clear(self):
+        self.pos = 0
+        self.n = 0
+        self.start = self.maxlen
+
+class CandleSeries(CandleWindow):
+    # Historique complet en colonnes (backtest, relecture), forme deja
+    # calculee. Les colonnes sont des memoryview sur les tableaux NumPy
+    # (lecture scalaire rapide, aucune copie, memoire partagee possible).
+    __slots__ = ("o", "h", "l", "c", "t", "fb", "fr", "fu", "fl",
+                 "no", "nh", "nl", "nc", "nt")
+
+    def __init__(self, o, h, l, c, t, features=None):
+        self.no = np.ascontiguousarray(o, dtype=np.float64)
+        self.nh = np.ascontiguousarray(h, dtype=np.float64)
+        self.nl = np.ascontiguousarray(l, dtype=np.float64)
+        self.nc = np.ascontiguousarray(c, dtype=np.float64)
+        self.nt = np.ascontiguousarray(t, dtype=np.int64)
+        if features is None:
+            features = candle_features(self.no, self.nh, self.nl, self.nc)
+        self.o, self.h, self.l, self.c, self.t = (
+            memoryview(x) for x in (self.no, self.nh, self.nl, self.nc, self.nt))
+        self.fb, self.fr, self.fu, self.fl = (
+            memoryview(np.ascontiguousarray(x, dtype=np.float64)) for x in features)
+        super().__init__(self, 0, len(self.nt))
+
 class Zone:
     def __init__(self, high, low, ztype, ctime):
         self.high        = high
@@ -110,6 +619,62 @@ class Trade:
         self.profit       = 0
         self.contract_id  = None
         self.pattern      = ""
+        self.provisional  = None    # profit calcule localement (local_settle)
+
+def tf_name(gran):
+    # 900 -> "M15", 3600 -> "H1"
+    return f"H{gran // 3600}" if gran % 3600 == 0 else f"M{gran // 60}"
+
+class BarBuilder:
+    # Bougies de chaque granularite d'un symbole, construites en une passe
+    # depuis ses ticks (ou des bougies plus fines). add() renvoie les evenements (granularite, bougie,
+    # cloturee) : la fin d'une bougie (cloturee, version finale) precede
+    # la premiere version de la suivante.
+
+    def __init__(self, grans):
+        self.grans = sorted(grans)
+        self.cur   = {}         # granularite -> Candle en cours
+
+    def add(self, epoch, quote):
+        return self._add(epoch, quote, quote, quote, quote)
+
+    def add_bar(self, candle):
+        # Version (provisoire ou finale) d'une bougie plus fine : extremes
+        # cumules, cloture remplacee
+        return self._add(candle.time, candle.open, candle.high,
+                         candle.low, candle.close)
+
+    def _add(self, epoch, o, h, l, c):
+        events = []
+        for gran in self.grans:
+            start = epoch - epoch % gran
+            bar = self.cur.get(gran)
+            if bar is not None and start < bar.time:
+                continue        # tick en retard
+            if bar is None or start > bar.time:
+                if bar is not None:
+                    events.append((gran, bar, True))
+                bar = self.cur[gran] = Candle(o, h, l, c, start)
+            else:
+                if h > bar.high:
+                    bar.high = h
+                if l < bar.low:
+                    bar.low = l
+                bar.close = c
+            events.append((gran, bar, False))
+        return events
+
+    def seed(self, gran, candle):
+        # Bougie en cours connue par l'historique : ouverture et extremes
+        # d'avant le premier tick recu
+        bar = self.cur.get(gran)
+        if bar is None or bar.time < candle.time:
+            self.cur[gran] = Candle(candle.open, candle.high, candle.low,
+                                    candle.close, candle.time)
+        elif bar.time == candle.time:
+            bar.open = candle.open
+            bar.high = max(bar.high, candle.high)
+            bar.low  = min(bar.low, candle.low)
 
 # ============================================================
 #                  ZONES S/R
@@ -121,63 +686,135 @@ class ZoneDetector:
         self.depth     = CONFIG["zz_depth"]
         self.backstep  = CONFIG["zz_backstep"]
         self.max_touch = CONFIG["max_touches"]
+        self.engine    = CONFIG["zone_engine"]
 
+    @timed("lz_zones_seconds", "compute")
     def compute_zones(self, m15_candles):
+        candles = _seq(m15_candles)
+        if len(candles) < 50:
+            return []
+        return self.select(self.candidates(candles))
+
+    @timed("lz_zones_seconds", "compute")
+    def compute_zones_np(self, o, h, l, c, t):
+        if len(h) < 50:
+            return []
+        return self.select(self.candidates_np(o, h, l, c, t))
+
+    def candidates(self, candles):
+        # Tous les pivots du buffer, avant dedoublonnage
+        if self.engine == "numpy":
+            return self.candidates_np(*candle_arrays(candles))
         zones = []
-        candles = list(m15_candles)
         count = len(candles)
-        if count < 50:
-            return zones
-
+        cols = candle_columns(candles)
         for i in range(self.depth, count - self.backstep):
-            is_high = True
-            is_low  = True
-
-            for j in range(1, self.depth + 1):
-                left  = i - j
-                right = i + j
-                if left < 0 or right >= count:
-                    is_high = False
-                    is_low  = False
-                    break
+            zones.extend(self._pivot(cols, i, count))
+        return zones
 
-                if candles[i].high < candles[left].high or \
-                   candles[i].high < candles[right].high:
-                    is_high = False
-                if candles[i].low > candles[left].low or \
-                   candles[i].low > candles[right].low:
-                    is_low = False
+    def candidates_np(self, o, h, l, c, t):
+        # Meme resultat que candidates(), en vectorise : pivots par max/min
+        # glissant, cassure par recherche de la premiere cloture au-dela
+        d = self.depth
+        n = len(h)
+        stop = min(n - self.backstep, n - d)
+        if stop <= d:
+            return []
+        idx = np.arange(d, stop)
+        hmax = sliding_window_view(h, 2 * d + 1).max(axis=1)
+        lmin = sliding_window_view(l, 2 * d + 1).min(axis=1)
+        hi = idx[h[idx] >= hmax[idx - d]]
+        lo = idx[l[idx] <= lmin[idx - d]]
+
+        hz = h[hi]
+        hl = np.maximum(o[hi], c[hi])
+        hl = np.where(hz - hl < 1e-5, hz - 0.001, hl)
+        lz = l[lo]
+        lh = np.minimum(o[lo], c[lo])
+        lh = np.where(lh - lz < 1e-5, lz + 0.001, lh)
+
+        hb = _first_beyond(c, hi + 1, hz, 1)
+        lb = _first_beyond(c, lo + 1, lz, -1)
+
+        # Ordre de compute_zones : par bougie, haut avant bas
+        pos  = np.concatenate((hi, lo))
+        typ  = np.concatenate((np.full(len(hi), -1), np.ones(len(lo), int)))
+        high = np.concatenate((hz, lh))
+        low  = np.concatenate((hl, lz))
+        brk  = np.concatenate((hb, lb))
+        order = np.argsort(pos * 2 + (typ == 1), kind="stable")
+
+        tt = t[pos[order]].tolist()
+        bt = np.where(brk[order] < n, t[np.minimum(brk[order], n - 1)], 0).tolist()
+        zones = []
+        for zh, zl, zt, ct, bk in zip(high[order].tolist(), low[order].tolist(),
+                                      typ[order].tolist(), tt, bt):
+            zone = Zone(zh, zl, zt, ct)
+            zone.broken_time = bk
+            zones.append(zone)
+        return zones
 
-                if not is_high and not is_low:
-                    break
+    def select(self, candidates):
+        # Seules les zones retenues et non cassees peuvent en masquer d'autres
+        zones = []
+        live = {1: [], -1: []}
+        for zone in candidates:
+            if not self._is_dup(zone, live[zone.type]):
+                zones.append(zone)
+                if zone.broken_time == 0:
+                    live[zone.type].append(zone)
+        return zones
 
-            if is_high:
-                zh = candles[i].high
-                zl = max(candles[i].open, candles[i].close)
-                if zh - zl < 1e-5:
-                    zl = zh - 0.001
-                zone = Zone(zh, zl, -1, candles[i].time)
-                for k in range(i + 1, count):
-                    if candles[k].close > zh:
-                        zone.broken_time = candles[k].time
-                        break
-                if not self._is_dup(zone, zones):
-                    zones.append(zone)
-
-            if is_low:
-                zh = min(candles[i].open, candles[i].close)
-                zl = candles[i].low
-                if zh - zl < 1e-5:
-                    zh = zl + 0.001
-                zone = Zone(zh, zl, 1, candles[i].time)
-                for k in range(i + 1, count):
-                    if candles[k].close < zl:
-                        zone.broken_time = candles[k].time
-                        break
-                if not self._is_dup(zone, zones):
-                    zones.append(zone)
+    def _pivot(self, cols, i, count):
+        # cols = candle_columns(...) : acces direct aux colonnes
+        (o, h, l, c, t), base = cols
+        out = []
+        is_high = True
+        is_low  = True
+        x  = base + i
+        hi = h[x]
+        lo = l[x]
+
+        for j in range(1, self.depth + 1):
+            left  = i - j
+            right = i + j
+            if left < 0 or right >= count:
+                return out
+
+            if hi < h[x - j] or hi < h[x + j]:
+                is_high = False
+            if lo > l[x - j] or lo > l[x + j]:
+                is_low = False
+
+            if not is_high and not is_low:
+                return out
+
+        end = base + count
+        if is_high:
+            zh = hi
+            zl = max(o[x], c[x])
+            if zh - zl < 1e-5:
+                zl = zh - 0.001
+            zone = Zone(zh, zl, -1, t[x])
+            for k in range(x + 1, end):
+                if c[k] > zh:
+                    zone.broken_time = t[k]
+                    break
+            out.append(zone)
+
+        if is_low:
+            zh = min(o[x], c[x])
+            zl = lo
+            if zh - zl < 1e-5:
+                zh = zl + 0.001
+            zone = Zone(zh, zl, 1, t[x])
+            for k in range(x + 1, end):
+                if c[k] < zl:
+                    zone.broken_time = t[k]
+                    break
+            out.append(zone)
 
-        return zones
+        return out
 
     def _is_dup(self, sp, zones):
         for z in zones:
@@ -208,12 +845,477 @@ class ZoneDetector:
                     return z
         return None
 
+def candle_arrays(candles):
+    # open, high, low, close, time en tableaux NumPy
+    if isinstance(candles, CandleWindow):
+        return candles.arrays()
+    data = np.array([(x.open, x.high, x.low, x.close, x.time) for x in candles],
+                    dtype=float).reshape(-1, 5)
+    return (data[:, 0], data[:, 1], data[:, 2], data[:, 3],
+            data[:, 4].astype(np.int64))
+
+def candle_columns(candles):
+    # ((open, high, low, close, time), decalage) : colonnes indexables
+    # directement, sans objet par bougie
+    if isinstance(candles, CandleWindow):
+        b = candles.buf
+        return (b.o, b.h, b.l, b.c, b.t), candles.start
+    cols = ([x.open for x in candles], [x.high for x in candles],
+            [x.low for x in candles], [x.close for x in candles],
+            [x.time for x in candles])
+    return cols, 0
+
+def _seq(candles):
+    # Sequence indexable en O(1) (les deque ne le sont pas au milieu)
+    return candles if isinstance(candles, (list, CandleWindow)) else list(candles)
+
+def _first_beyond(close, start, level, side):
+    # Pour chaque requete, premier indice k >= start tel que close[k] > level
+    # (side=1) ou close[k] < level (side=-1) ; len(close) si aucun.
+    # Table creuse de max/min + sauts binaires : O((n + q) log n).
+    n = len(close)
+    pos = np.asarray(start, dtype=np.int64).copy()
+    if n == 0 or len(pos) == 0:
+        return np.full(len(pos), n, dtype=np.int64)
+    table = [close]
+    step = 1
+    while step * 2 <= n:
+        prev = table[-1]
+        red = np.maximum if side == 1 else np.minimum
+        table.append(red(prev[:-step], prev[step:]))
+        step *= 2
+    for j in range(len(table) - 1, -1, -1):
+        step = 1 << j
+        col = table[j]
+        fits = pos + step <= n
+        val = col[np.minimum(pos, len(col) - 1)]
+        skip = fits & ((val <= level) if side == 1 else (val >= level))
+        pos = np.where(skip, pos + step, pos)
+    return pos
+
+class ZoneIndex:
+    # Zones vivantes triees par prix (bas de zone), une liste par type.
+    # find() ne parcourt que les zones dont le bas est dans
+    # [debut requete - largeur max, fin requete] : O(log z + k).
+
+    def __init__(self, max_touch):
+        self.max_touch = max_touch
+        self.clear()
+
+    def clear(self):
+        self.keys  = {1: [], -1: []}    # (low, create_time)
+        self.items = {1: [], -1: []}
+        self.width = {1: 0.0, -1: 0.0}
+
+    def __len__(self):
+        return len(self.items[1]) + len(self.items[-1])
+
+    def add(self, z):
+        if z.touch_count >= self.max_touch:
+            return
+        key = (z.low, z.create_time)
+        keys = self.keys[z.type]
+        j = bisect_right(keys, key)
+        keys.insert(j, key)
+        self.items[z.type].insert(j, z)
+        if z.high - z.low > self.width[z.type]:
+            self.width[z.type] = z.high - z.low
+
+    def remove(self, z):
+        keys  = self.keys[z.type]
+        items = self.items[z.type]
+        key = (z.low, z.create_time)
+        j = bisect_left(keys, key)
+        while j < len(keys) and keys[j] == key:
+            if items[j] is z:
+                del keys[j]
+                del items[j]
+                return
+            j += 1
+
+    def find(self, candle, now):
+        # Meme regles que ZoneDetector.find_zone : la zone creee le plus
+        # recemment l'emporte (a heure egale, la zone support)
+        best = None
+        for ztype, a, b in ((1, candle.low, candle.close),
+                            (-1, candle.close, candle.high)):
+            keys  = self.keys[ztype]
+            items = self.items[ztype]
+            lim = a - 2 * self.width[ztype]
+            j = bisect_right(keys, (b, float("inf"))) - 1
+            while j >= 0 and keys[j][0] >= lim:
+                z = items[j]
+                j -= 1
+                if z.high < a or z.create_time >= now:
+                    continue
+                if z.broken_time > 0 and z.broken_time <= now:
+                    continue
+                if z.touch_count >= self.max_touch:
+                    continue
+                if best is None or (z.create_time, z.type) > (best.create_time, best.type):
+                    best = z
+        return best
+
+class ZoneTracker:
+    # Zones d'un symbole tenues a jour bougie par bougie : a chaque nouvelle
+    # M15 on ne decide que les pivots devenus decidables, on marque les
+    # cassures et on sort les pivots tombes du buffer. Le resultat est le
+    # meme que compute_zones sur le buffer, mais les objets Zone (et donc
+    # touch_count) sont conserves d'une bougie a l'autre.
+
+    def __init__(self, zd):
+        self.zd        = zd
+        self.cands     = []     # tous les pivots du buffer, ordre chronologique
+        self.zones     = []     # pivots retenus (= compute_zones)
+        self.kept      = set()
+        self.open      = []     # pivots non casses
+        self.pending   = []     # casses par la bougie en cours (provisoire)
+        self.last_time = 0
+        self.ready     = False
+        self.index     = ZoneIndex(zd.max_touch)
+
+    def find(self, candle, now):
+        return self.index.find(candle, now)
+
+    def touch(self, zone):
+        zone.touch_count += 1
+        if zone.touch_count >= self.zd.max_touch:
+            self.index.remove(zone)
+
+    def touched(self, ztype, ctime):
+        # Touche faite sur une copie publiee (ZoneView), reportee ici
+        for z in reversed(self.cands):
+            if z.type == ztype and z.create_time == ctime:
+                self.touch(z)
+                return
+
+    @timed("lz_zones_seconds", "reset")
+    def reset(self, m15_candles):
+        touches = {(z.type, z.create_time): z.touch_count for z in self.cands}
+        candles = _seq(m15_candles)
+        self.ready = len(candles) >= 50
+        self.cands = self.zd.candidates(candles) if self.ready else []
+        self.last_time = candles[-1].time if candles else 0
+        for z in self.cands:
+            z.touch_count = touches.get((z.type, z.create_time), 0)
+        self.open    = [z for z in self.cands if z.broken_time == 0]
+        self.pending = [z for z in self.cands
+                        if z.broken_time and z.broken_time == self.last_time]
+        self._select()
+        return self.zones
+
+    @timed("lz_zones_seconds", "update")
+    def update(self, candles):
+        # Appele juste apres l'ajout d'une nouvelle bougie (en cours) au buffer
+        count = len(candles)
+        if not self.ready or count < 2 or candles[-2].time != self.last_time:
+            return self.reset(candles)
+
+        zd    = self.zd
+        d     = zd.depth
+        prev  = candles[-2]     # vient de cloturer
+        new   = candles[-1]     # en cours, valeurs provisoires
+        dirty = False
+
+        # Pivots sortis de la partie exploitable du buffer (indice < depth)
+        limit = candles[d].time
+        n = 0
+        while n < len(self.cands) and self.cands[n].create_time < limit:
+            z = self.cands[n]
+            if z in self.kept:
+                self.kept.discard(z)
+                if z.broken_time == 0:
+                    dirty = True
+            self._drop(z)
+            n += 1
+        del self.cands[:n]
+        while self.zones and self.zones[0] not in self.kept:
+            self.zones.pop(0)
+
+        # Les pivots decides avec la bougie precedente encore en cours
+        # sont re-decides avec ses valeurs finales
+        last  = min(count - 1 - d, count - 1 - zd.backstep)
+        first = max(last - 1, d)
+        t0 = candles[first].time if first < count else new.time
+        touches = {}
+        while self.cands and self.cands[-1].create_time >= t0:
+            z = self.cands.pop()
+            touches[(z.type, z.create_time)] = z.touch_count
+            self.kept.discard(z)
+            self._drop(z)
+        while self.zones and self.zones[-1] not in self.kept:
+            self.zones.pop()
+
+        # Cassures provisoires : verification sur la cloture finale
+        for z in self.pending:
+            if (z.type == -1 and prev.close > z.high) or \
+               (z.type == 1 and prev.close < z.low):
+                self.index.remove(z)
+                continue
+            z.broken_time = 0
+            self.open.append(z)
+            if z in self.kept:
+                dirty = True
+        self.pending = []
+
+        still = []
+        pc, pt = prev.close, prev.time
+        nc, nt = new.close, new.time
+        for z in self.open:
+            if z.type == -1:
+                if pc > z.high:
+                    z.broken_time = pt
+                elif nc > z.high:
+                    z.broken_time = nt
+            else:
+                if pc < z.low:
+                    z.broken_time = pt
+                elif nc < z.low:
+                    z.broken_time = nt
+            if z.broken_time == 0:
+                still.append(z)
+                continue
+            if z.broken_time == new.time:
+                self.pending.append(z)
+            else:
+                self.index.remove(z)
+            if z in self.kept:
+                dirty = True
+        self.open = still
+
+        # Nouveaux pivots decidables
+        tail = []
+        cols = candle_columns(candles)
+        for i in range(first, last + 1):
+            tail.extend(zd._pivot(cols, i, count))
+        for z in tail:
+            z.touch_count = touches.get((z.type, z.create_time), 0)
+            self.cands.append(z)
+            if z.broken_time == 0:
+                self.open.append(z)
+            elif z.broken_time == new.time:
+                self.pending.append(z)
+
+        self.last_time = new.time
+        if dirty:
+            self._select()
+        else:
+            for z in tail:
+                if not zd._is_dup(z, self.zones):
+                    self.zones.append(z)
+                    self.kept.add(z)
+                    if z.broken_time == 0 or z.broken_time == new.time:
+                        self.index.add(z)
+        return self.zones
+
+    def snapshot(self):
+        # Zones retenues et pivots deja touches, avec la derniere bougie vue
+        zones = [z for z in self.cands if z in self.kept or z.touch_count]
+        return {"last_time": self.last_time,
+                "zones": [[z.low, z.high, z.type, z.create_time,
+                           z.broken_time, z.touch_count] for z in zones]}
+
+    def restore(self, snap):
+        # Touches d'un snapshot, appariees par (type, create_time)
+        touches = {(z[2], z[3]): z[5] for z in snap["zones"]}
+        n = 0
+        for z in self.cands:
+            count = touches.get((z.type, z.create_time))
+            if count is not None:
+                z.touch_count = count
+                n += 1
+        self._select()
+        return n
+
+    def _drop(self, z):
+        self.index.remove(z)
+        if z.broken_time == 0:
+            self.open.remove(z)
+        elif z in self.pending:
+            self.pending.remove(z)
+
+    def _select(self):
+        self.zones = self.zd.select(self.cands)
+        self.kept  = set(self.zones)
+        self.index.clear()
+        for z in self.zones:
+            if z.broken_time == 0 or z.broken_time == self.last_time:
+                self.index.add(z)
+
+class ZoneView:
+    # Zones publiees par un ZoneWorker : copies des zones d'un ZoneTracker,
+    # lues et touchees par la boucle pendant que le worker calcule la
+    # version suivante. Meme lecture que ZoneTracker (find, touch, snapshot).
+
+    def __init__(self, tracker):
+        self.max_touch = tracker.zd.max_touch
+        self.ready     = tracker.ready
+        self.last_time = tracker.last_time
+        copies = {}
+        for z in tracker.cands:
+            if z in tracker.kept or z.touch_count:
+                x = copies[z] = Zone(z.high, z.low, z.type, z.create_time)
+                x.broken_time = z.broken_time
+                x.touch_count = z.touch_count
+        self.zones = [copies[z] for z in tracker.zones]
+        self.saved = list(copies.values())      # contenu du snapshot
+        src = tracker.index
+        self.index = ZoneIndex(self.max_touch)
+        for t in (1, -1):
+            self.index.keys[t]  = list(src.keys[t])
+            self.index.items[t] = [copies[z] for z in src.items[t]]
+            self.index.width[t] = src.width[t]
+
+    def find(self, candle, now):
+        return self.index.find(candle, now)
+
+    def touch(self, zone):
+        zone.touch_count += 1
+        if zone.touch_count >= self.max_touch:
+            self.index.remove(zone)
+
+    def carry(self, old):
+        # Touches faites sur l'ancienne vue pendant le calcul de celle-ci
+        prev = {(z.type, z.create_time): z.touch_count
+                for z in old.saved if z.touch_count}
+        if not prev:
+            return
+        for z in self.saved:
+            n = prev.get((z.type, z.create_time), 0)
+            if n > z.touch_count:
+                z.touch_count = n
+                if n >= self.max_touch:
+                    self.index.remove(z)
+
+    def snapshot(self):
+        return {"last_time": self.last_time,
+                "zones": [[z.low, z.high, z.type, z.create_time,
+                           z.broken_time, z.touch_count] for z in self.saved]}
+
+class ZoneWorker:
+    # Zones d'un symbole calculees hors de la boucle websocket. Le
+    # ZoneTracker ne vit que dans le thread du worker (un par symbole, les
+    # calculs d'un symbole restent dans l'ordre) ; la boucle sert find()
+    # depuis la derniere ZoneView publiee, remplacee d'un bloc quand la
+    # suivante est prete. Sans thread (backtest), calcul sur place et
+    # find() servi par le ZoneTracker lui-meme, sans copie.
+
+    def __init__(self, zd, name=None, on_publish=None):
+        self.name       = name
+        self.tracker    = ZoneTracker(zd)
+        self.pool       = (ThreadPoolExecutor(1, thread_name_prefix=f"zones-{name}")
+                           if name else None)
+        self.view       = ZoneView(self.tracker) if self.pool else self.tracker
+        self.on_publish = on_publish
+        self.seq        = 0         # calculs soumis
+        self.shown      = 0         # calcul de la vue publiee
+        self.stale      = 0.0       # perf_counter du 1er calcul non publie
+        self.stale_checks = 0       # controles de signal depuis stale
+
+    def find(self, candle, now):
+        return self.view.find(candle, now)
+
+    def touch(self, zone):
+        self.view.touch(zone)
+        if self.pool is not None:
+            self.pool.submit(self.tracker.touched, zone.type, zone.create_time)
+
+    def update(self, buf):
+        # Nouvelle bougie M15 dans buf : sans attente, publie plus tard
+        if not self.stale:
+            self.stale = time.perf_counter()
+            self.stale_checks = 0
+        self.submit(self.tracker.update, buf.copy() if self.pool else buf)
+
+    async def reset(self, buf, snap=None):
+        # Recalcul complet, puis touches du snapshot s'il y en a un ;
+        # renvoie le nombre de zones reprises (None : snapshot non applique)
+        return await self.call(self._reset, buf.copy() if self.pool else buf, snap)
+
+    def _reset(self, candles, snap):
+        self.tracker.reset(candles)
+        if snap and self.tracker.ready:
+            return self.tracker.restore(snap)
+        return None
+
+    def lag(self):
+        # Age des zones servies (0 : a jour), compte dans la metrique
+        if not self.stale:
+            return 0.0
+        wait = time.perf_counter() - self.stale
+        self.stale_checks += 1
+        METRICS.observe("lz_zone_lag_seconds", wait, self.name or "")
+        return wait
+
+    def submit(self, fn, *args):
+        # Resultat de fn en mode sur place, future (resultat, vue) sinon
+        self.seq += 1
+        seq = self.seq
+        if self.pool is None:
+            res, view = self._run(seq, fn, args)
+            self._publish(seq, view)
+            return res
+        fut = asyncio.get_running_loop().run_in_executor(
+            self.pool, self._run, seq, fn, args)
+        fut.add_done_callback(lambda f: self._done(seq, f))
+        return fut
+
+    async def call(self, fn, *args):
+        # submit() en attendant le resultat ; la vue est deja publiee
+        res = self.submit(fn, *args)
+        if self.pool is not None:
+            res = (await res)[0]
+        return res
+
+    def _run(self, seq, fn, args):
+        # Thread du worker. Vue non construite si un calcul plus recent
+        # est deja en file : elle serait remplacee aussitot.
+        res = fn(*args)
+        if self.pool is None:
+            return res, self.tracker
+        if seq < self.seq:
+            return res, None
+        return res, ZoneView(self.tracker)
+
+    def _done(self, seq, fut):
+        if fut.cancelled():
+            return
+        if fut.exception() is not None:
+            log.error("Zones %s: %s", self.name, fut.exception())
+            if seq == self.seq:
+                self.stale = 0.0
+            return
+        self._publish(seq, fut.result()[1])
+
+    def _publish(self, seq, view):
+        if view is None or seq <= self.shown:
+            return
+        if view is not self.view:
+            view.carry(self.view)
+        self.view  = view
+        self.shown = seq
+        if seq == self.seq and self.stale:
+            if self.stale_checks:
+                log.info("%s | %d controles de signal sur zones perimees, "
+                         "zones a jour en %.0f ms", self.name, self.stale_checks,
+                         (time.perf_counter() - self.stale) * 1000)
+            self.stale = 0.0
+        if self.on_publish:
+            self.on_publish()
+
 # ============================================================
 #                  PATTERNS
 # ============================================================
 
 class Patterns:
+    # Ordre de priorite de scan() ; les Doji sont en dernier (use_doji)
+    BULL = ("Engulfing Haussier", "Marteau", "Pin Bar Haussiere",
+            "Etoile du Matin", "Doji Haussier")
+    BEAR = ("Engulfing Baissier", "Etoile Filante", "Pin Bar Baissiere",
+            "Etoile du Soir", "Doji Baissier")
+
     @staticmethod
+    @timed("lz_scan_seconds")
     def scan(candles, zone_type):
         if len(candles) < 3:
             return 0, ""
@@ -238,102 +1340,498 @@ class Patterns:
 
         return 0, ""
 
+    # Les regles lisent body / rng / uw / lw, calcules une seule fois a la
+    # cloture de la bougie (CandleBuffer) au lieu d'etre recalcules par
+    # chaque detecteur.
+
     @staticmethod
     def _bull_engulf(c, i):
-        pb = abs(c[i-1].close - c[i-1].open)
-        cb = abs(c[i].close - c[i].open)
+        p, x = c[i-1], c[i]
+        pb = p.body
+        cb = x.body
         if pb == 0 or cb == 0: return False
-        return (c[i-1].close < c[i-1].open and c[i].close > c[i].open and
-                c[i].open <= c[i-1].close and c[i].close >= c[i-1].open and
+        return (p.close < p.open and x.close > x.open and
+                x.open <= p.close and x.close >= p.open and
                 cb >= pb * 0.8)
 
     @staticmethod
     def _hammer(c, i):
-        body = abs(c[i].close - c[i].open)
-        rng  = c[i].high - c[i].low
+        x = c[i]
+        body = x.body
+        rng  = x.rng
         if rng == 0 or body == 0: return False
-        lw = min(c[i].open, c[i].close) - c[i].low
-        uw = c[i].high - max(c[i].open, c[i].close)
-        return lw >= body * 2 and uw <= body * 0.5 and body / rng < 0.4
+        return x.lw >= body * 2 and x.uw <= body * 0.5 and body / rng < 0.4
 
     @staticmethod
     def _bull_pin(c, i):
-        rng = c[i].high - c[i].low
+        x = c[i]
+        rng = x.rng
         if rng == 0: return False
-        lw = min(c[i].open, c[i].close) - c[i].low
-        uw = c[i].high - max(c[i].open, c[i].close)
-        return lw / rng >= 0.66 and uw / rng <= 0.15
+        return x.lw / rng >= 0.66 and x.uw / rng <= 0.15
 
     @staticmethod
     def _morning(c, i):
         if i < 2: return False
-        b1 = abs(c[i-2].close - c[i-2].open)
-        b2 = abs(c[i-1].close - c[i-1].open)
-        b3 = abs(c[i].close - c[i].open)
+        a, x = c[i-2], c[i]
+        b1 = a.body
+        b2 = c[i-1].body
+        b3 = x.body
         if b1 == 0: return False
-        return (c[i-2].close < c[i-2].open and b2 < b1 * 0.4 and
-                c[i].close > c[i].open and b3 > b1 * 0.5 and
-                c[i].close > (c[i-2].open + c[i-2].close) / 2)
+        return (a.close < a.open and b2 < b1 * 0.4 and
+                x.close > x.open and b3 > b1 * 0.5 and
+                x.close > (a.open + a.close) / 2)
 
     @staticmethod
     def _bear_engulf(c, i):
-        pb = abs(c[i-1].close - c[i-1].open)
-        cb = abs(c[i].close - c[i].open)
+        p, x = c[i-1], c[i]
+        pb = p.body
+        cb = x.body
         if pb == 0 or cb == 0: return False
-        return (c[i-1].close > c[i-1].open and c[i].close < c[i].open and
-                c[i].open >= c[i-1].close and c[i].close <= c[i-1].open and
+        return (p.close > p.open and x.close < x.open and
+                x.open >= p.close and x.close <= p.open and
                 cb >= pb * 0.8)
 
     @staticmethod
     def _shooting(c, i):
-        body = abs(c[i].close - c[i].open)
-        rng  = c[i].high - c[i].low
+        x = c[i]
+        body = x.body
+        rng  = x.rng
         if rng == 0 or body == 0: return False
-        uw = c[i].high - max(c[i].open, c[i].close)
-        lw = min(c[i].open, c[i].close) - c[i].low
-        return uw >= body * 2 and lw <= body * 0.5 and body / rng < 0.4
+        return x.uw >= body * 2 and x.lw <= body * 0.5 and body / rng < 0.4
 
     @staticmethod
     def _bear_pin(c, i):
-        rng = c[i].high - c[i].low
+        x = c[i]
+        rng = x.rng
         if rng == 0: return False
-        uw = c[i].high - max(c[i].open, c[i].close)
-        lw = min(c[i].open, c[i].close) - c[i].low
-        return uw / rng >= 0.66 and lw / rng <= 0.15
+        return x.uw / rng >= 0.66 and x.lw / rng <= 0.15
 
     @staticmethod
     def _evening(c, i):
         if i < 2: return False
-        b1 = abs(c[i-2].close - c[i-2].open)
-        b2 = abs(c[i-1].close - c[i-1].open)
-        b3 = abs(c[i].close - c[i].open)
+        a, x = c[i-2], c[i]
+        b1 = a.body
+        b2 = c[i-1].body
+        b3 = x.body
         if b1 == 0: return False
-        return (c[i-2].close > c[i-2].open and b2 < b1 * 0.4 and
-                c[i].close < c[i].open and b3 > b1 * 0.5 and
-                c[i].close < (c[i-2].open + c[i-2].close) / 2)
+        return (a.close > a.open and b2 < b1 * 0.4 and
+                x.close < x.open and b3 > b1 * 0.5 and
+                x.close < (a.open + a.close) / 2)
 
     @staticmethod
     def _doji(c, i, ztype):
-        body = abs(c[i].close - c[i].open)
-        rng  = c[i].high - c[i].low
+        x = c[i]
+        body = x.body
+        rng  = x.rng
         if rng == 0 or body / rng >= 0.15: return False
-        uw = c[i].high - max(c[i].open, c[i].close)
-        lw = min(c[i].open, c[i].close) - c[i].low
-        if ztype == 1 and lw / rng > 0.45:  return True
-        if ztype == -1 and uw / rng > 0.45: return True
+        if ztype == 1 and x.lw / rng > 0.45:  return True
+        if ztype == -1 and x.uw / rng > 0.45: return True
         return False
 
+    # ---------- Mode batch (recherche / backtest) ----------
+
+    @staticmethod
+    def masks(o, h, l, c):
+        # Masque booleen par pattern sur des tableaux de bougies : masks[nom][i]
+        # vaut scan() sur les bougies 0..i pour ce seul pattern.
+        body, rng, uw, lw = candle_features(o, h, l, c)
+        n = len(c)
+        pb = np.r_[0.0, body[:-1]][:n]
+        po = np.r_[0.0, o[:-1]][:n]
+        pc = np.r_[0.0, c[:-1]][:n]
+        ab = np.r_[0.0, 0.0, body[:-2]][:n]
+        ao = np.r_[0.0, 0.0, o[:-2]][:n]
+        ac = np.r_[0.0, 0.0, c[:-2]][:n]
+        bull = c > o
+        bear = c < o
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            br = body / rng
+            ur = uw / rng
+            lr = lw / rng
+            ok = rng != 0
+            solid = ok & (body != 0)
+            m = {
+                "Engulfing Haussier": (pb != 0) & (body != 0) & (pc < po) & bull &
+                                      (o <= pc) & (c >= po) & (body >= pb * 0.8),
+                "Marteau":            solid & (lw >= body * 2) & (uw <= body * 0.5) & (br < 0.4),
+                "Pin Bar Haussiere":  ok & (lr >= 0.66) & (ur <= 0.15),
+                "Etoile du Matin":    (ab != 0) & (ac < ao) & (pb < ab * 0.4) & bull &
+                                      (body > ab * 0.5) & (c > (ao + ac) / 2),
+                "Doji Haussier":      ok & (br < 0.15) & (lr > 0.45),
+                "Engulfing Baissier": (pb != 0) & (body != 0) & (pc > po) & bear &
+                                      (o >= pc) & (c <= po) & (body >= pb * 0.8),
+                "Etoile Filante":     solid & (uw >= body * 2) & (lw <= body * 0.5) & (br < 0.4),
+                "Pin Bar Baissiere":  ok & (ur >= 0.66) & (lr <= 0.15),
+                "Etoile du Soir":     (ab != 0) & (ac > ao) & (pb < ab * 0.4) & bear &
+                                      (body > ab * 0.5) & (c < (ao + ac) / 2),
+                "Doji Baissier":      ok & (br < 0.15) & (ur > 0.45),
+            }
+        for v in m.values():
+            v[:2] = False       # scan() demande au moins 3 bougies
+        return m
+
+    @staticmethod
+    def first(masks, zone_type, use_doji=None):
+        # Indice dans BULL/BEAR du pattern retenu par scan() pour chaque
+        # bougie, -1 si aucun
+        if use_doji is None:
+            use_doji = CONFIG["use_doji"]
+        names = Patterns.BULL if zone_type == 1 else Patterns.BEAR
+        if not use_doji:
+            names = names[:-1]
+        n = len(masks[names[0]])
+        out = np.full(n, -1, dtype=np.int8)
+        for k in range(len(names) - 1, -1, -1):
+            out[masks[names[k]]] = k
+        return out
+
 # ============================================================
 #                  STATISTIQUES
 # ============================================================
 
+def trade_record(t):
+    return {
+        "time"       : t.signal_time,
+        "dir"        : t.direction,
+        "symbol"     : t.symbol,
+        "win"        : t.is_win,
+        "profit"     : t.profit,
+        "expiry"     : t.expiry,
+        "stake"      : t.stake,
+        "pattern"    : t.pattern,
+        "entry_price": t.entry_price,
+        "exit_price" : t.exit_price,
+        "contract_id": t.contract_id,
+        "result_time": t.result_time,
+    }
+
+def trade_from_record(d):
+    t = Trade(d["time"], d["dir"], d["symbol"], d.get("entry_price", 0),
+              d.get("stake", CONFIG["stake"]), d.get("expiry", 5))
+    t.is_win      = d["win"]
+    t.profit      = d["profit"]
+    t.pattern     = d.get("pattern", "")
+    t.exit_price  = d.get("exit_price", 0)
+    t.contract_id = d.get("contract_id")
+    t.result_time = d.get("result_time", 0)
+    return t
+
+def _reverse_lines(path, block=65536):
+    # Lignes d'un fichier de la derniere a la premiere, par blocs
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        rest = b""
+        while pos > 0:
+            n = min(block, pos)
+            pos -= n
+            f.seek(pos)
+            lines = (f.read(n) + rest).split(b"\n")
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if rest.strip():
+            yield rest
+
+class Journal:
+    # Trades en ajout seul (une ligne JSON par trade) au lieu de reecrire
+    # tout l'historique a chaque trade. fsync groupes (N lignes, ou un
+    # minuteur de journal_sync_secs apres la premiere ligne non synchronisee) ;
+    # au-dela de journal_compact lignes, les lignes du journal sont ajoutees
+    # au snapshot (fsync) puis le journal est vide : le cout d'une
+    # compaction ne depend que des lignes ajoutees depuis la precedente.
+    # Chaque ligne a un numero de sequence : apres un crash en pleine
+    # compaction, les lignes deja presentes dans le snapshot sont ignorees.
+    # Le chargement lit les fichiers depuis la fin et s'arrete des qu'il a
+    # depasse la periode demandee ; les agregats "total" sont gardes a part
+    # (<base>.totals.json, avec leur derniere seq), ecrits a chaque
+    # compaction par on_compact.
+
+    SLACK = 3600    # desordre max des heures de signal (trades simultanes)
+
+    def __init__(self, path):
+        self.path      = path
+        base, _ = os.path.splitext(path)
+        self.snap_path = base + ".snapshot.jsonl"
+        self.totals_path = base + ".totals.json"
+        self.f         = None
+        self.seq       = 0
+        self.lines     = 0
+        self.unsynced  = 0
+        self.last_sync = time.time()
+        self.timer     = None       # fsync differe (threading.Timer)
+        self.lock      = threading.RLock()  # append/compact remplacent self.f
+        self.on_compact = None      # fn(seq) apres compaction
+
+    def _last_seq(self, path):
+        for line in _reverse_lines(path):
+            try:
+                return json.loads(line)["seq"]
+            except (ValueError, KeyError):
+                continue
+        return 0
+
+    def _open(self):
+        snap_seq = self._last_seq(self.snap_path)
+        self.seq = max(snap_seq, self._last_seq(self.path))
+        self.lines = sum(1 for _ in _reverse_lines(self.path))
+        self.f = open(self.path, "ab")
+        # Ligne incomplete (crash en pleine ecriture) : on la termine
+        if self.f.tell() > 0:
+            with open(self.path, "rb") as r:
+                r.seek(-1, os.SEEK_END)
+                if r.read(1) != b"\n":
+                    self.f.write(b"\n")
+
+    def append(self, record):
+        with self.lock:
+            if self.f is None:
+                self._open()
+            self.seq += 1
+            record = dict(record, seq=self.seq)
+            self.f.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+            self.f.flush()
+            self.lines += 1
+            self.unsynced += 1
+            if (self.unsynced >= CONFIG["journal_sync_every"] or
+                    time.time() - self.last_sync >= CONFIG["journal_sync_secs"]):
+                self.sync()
+            elif self.timer is None:
+                # Bot inactif ensuite : lignes synchronisees quand meme
+                self.timer = threading.Timer(CONFIG["journal_sync_secs"], self.sync)
+                self.timer.daemon = True
+                self.timer.start()
+            if self.lines >= CONFIG["journal_compact"]:
+                self.compact()
+
+    def sync(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.f is None or not self.unsynced:
+                return
+            os.fsync(self.f.fileno())
+            self.unsynced = 0
+            self.last_sync = time.time()
+
+    def compact(self):
+        with self.lock:
+            if self.f is None:
+                self._open()
+            self.sync()
+            snap_seq = self._last_seq(self.snap_path)
+            last = snap_seq
+            with open(self.snap_path, "ab") as out:
+                # Ligne incomplete (crash en pleine compaction) : terminee,
+                # puis ignoree a la lecture
+                if out.tell() > 0:
+                    with open(self.snap_path, "rb") as r:
+                        r.seek(-1, os.SEEK_END)
+                        if r.read(1) != b"\n":
+                            out.write(b"\n")
+                with open(self.path, "rb") as f:
+                    for line in f:
+                        try:
+                            d = json.loads(line)
+                        except ValueError:
+                            continue
+                        if d.get("seq", 0) > snap_seq:
+                            out.write(line if line.endswith(b"\n") else line + b"\n")
+                            last = max(last, d["seq"])
+                out.flush()
+                os.fsync(out.fileno())
+            self.f.close()
+            self.f = open(self.path, "wb")      # journal vide
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.lines = 0
+            log.info("Journal compacte dans %s", self.snap_path)
+            if self.on_compact:
+                self.on_compact(last)
+
+    def read(self, since=0, after=None):
+        # Enregistrements dont l'heure de signal >= since (ou la seq > after),
+        # dans l'ordre d'ajout
+        snap_seq = self._last_seq(self.snap_path)
+        out = []
+        done = False
+        for path in (self.path, self.snap_path):
+            for line in _reverse_lines(path):
+                try:
+                    d = json.loads(line)
+                except ValueError:
+                    log.warning("Ligne illisible ignoree dans %s", path)
+                    continue
+                seq = d.get("seq", 0)
+                if path == self.path and seq <= snap_seq:
+                    continue
+                newer = after is not None and seq > after
+                if since and d["time"] < since - self.SLACK and not newer:
+                    done = True
+                    break
+                if d["time"] >= since or newer:
+                    out.append(d)
+            if done:
+                break
+        out.reverse()
+        return out
+
+    def load_totals(self):
+        # (seq, {symbole ou "*": etat Aggregate}) ; (0, {}) sans fichier valide
+        try:
+            with open(self.totals_path, "r") as f:
+                d = json.load(f)
+            return int(d["seq"]), d["aggs"]
+        except FileNotFoundError:
+            return 0, {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("Totaux stats illisibles (%s) : relecture complete", e)
+            return 0, {}
+
+    def save_totals(self, seq, aggs):
+        with self.lock:
+            tmp = self.totals_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"seq": seq, "aggs": aggs}, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.totals_path)
+
+    def migrate(self, legacy):
+        # Ancien format : tableau JSON complet reecrit a chaque trade
+        if not os.path.exists(legacy):
+            return
+        if os.path.exists(self.path) or os.path.exists(self.snap_path):
+            return
+        with open(legacy, "r") as f:
+            data = json.load(f)
+        for d in data:
+            self.append(d)
+        self.sync()
+        os.replace(legacy, legacy + ".bak")
+        log.info("%d trades importes depuis %s", len(data), legacy)
+
+def period_start(period, ts):
+    # Debut (heure locale) du jour / de la semaine / du mois contenant ts
+    d = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        d -= timedelta(days=d.weekday())
+    elif period == "month":
+        d = d.replace(day=1)
+    return d.timestamp()
+
+class Aggregate:
+    # Compteurs de Stats.calc tenus a jour trade par trade, en O(1)
+    __slots__ = ("start", "w", "l", "cw", "cl", "max_w", "max_l",
+                 "sw", "nw", "sl", "nl")
+
+    def __init__(self, start=0):
+        self.start = start
+        self.w = self.l = 0
+        self.cw = self.cl = 0           # series en cours
+        self.max_w = self.max_l = 0
+        self.sw = self.nw = 0           # somme / nombre de series W terminees
+        self.sl = self.nl = 0
+
+    def add(self, is_win):
+        if is_win:
+            self.w += 1
+            self.cw += 1
+            if self.cl > 0:
+                self.sl += self.cl
+                self.nl += 1
+                self.cl = 0
+            if self.cw > self.max_w:
+                self.max_w = self.cw
+        else:
+            self.l += 1
+            self.cl += 1
+            if self.cw > 0:
+                self.sw += self.cw
+                self.nw += 1
+                self.cw = 0
+            if self.cl > self.max_l:
+                self.max_l = self.cl
+
+    def state(self):
+        return [getattr(self, k) for k in self.__slots__]
+
+    @classmethod
+    def from_state(cls, state):
+        agg = cls()
+        for k, v in zip(cls.__slots__, state):
+            setattr(agg, k, v)
+        return agg
+
+    def result(self):
+        w, l = self.w, self.l
+        t = w + l
+        nw = self.nw + (1 if self.cw > 0 else 0)
+        nl = self.nl + (1 if self.cl > 0 else 0)
+        if self.cw > 0:
+            cs = self.cw
+        elif self.cl > 0:
+            cs = -self.cl
+        else:
+            cs = 0
+        return {
+            "wins"          : w,
+            "losses"        : l,
+            "total"         : t,
+            "winrate"       : (w / t * 100) if t > 0 else 0,
+            "profit"        : (w * CONFIG["payout"] / 100) - l,
+            "streak"        : cs,
+            "max_w"         : self.max_w,
+            "max_l"         : self.max_l,
+            "avg_w_streak"  : ((self.sw + self.cw) / nw) if nw else 0.0,
+            "avg_l_streak"  : ((self.sl + self.cl) / nl) if nl else 0.0,
+        }
+
 class Stats:
-    def __init__(self):
+    PERIODS = ("day", "week", "month")
+
+    def __init__(self, path=None):
+        # path : journal des trades (None : pas de persistance, backtest)
+        self.journal = Journal(path) if path else None
         self.results = []
+        # Agregats (periode, symbole) -> Aggregate de la periode courante ;
+        # periode "total" = tout l'historique, symbole None = tous
+        self.aggs = {}
+        self._report = None     # (cle, texte) de format_all
+
+    def _account(self, trade, periods=True, total=True):
+        starts = {p: period_start(p, trade.signal_time) for p in self.PERIODS} if periods else {}
+        if total:
+            starts["total"] = 0
+        for period, start in starts.items():
+            for sym in (None, trade.symbol):
+                agg = self.aggs.get((period, sym))
+                if agg is None or agg.start < start:
+                    agg = self.aggs[(period, sym)] = Aggregate(start)
+                if agg.start == start:
+                    agg.add(trade.is_win)
+                # sinon : trade d'une periode deja passee (regle en retard)
+
+    def _current(self, period, symbol=None):
+        start = period_start(period, time.time()) if period != "total" else 0
+        agg = self.aggs.get((period, symbol))
+        if agg is None or agg.start != start:
+            agg = Aggregate(start)
+        return agg.result()
 
     def add(self, trade):
         self.results.append(trade)
-        self.save()
+        self._account(trade)
+        if self.journal:
+            try:
+                self.journal.append(trade_record(trade))
+            except (OSError, ValueError, TypeError) as e:
+                log.error("Journal stats: %s", e)
 
     def calc(self, from_time=0, symbol=None):
         w = l = 0
@@ -401,25 +1899,36 @@ class Stats:
             "avg_l_streak"  : avg_l,   # moyenne des séries perdantes
         }
 
+    # today/week/month/total : memes chiffres que calc() depuis le debut de
+    # la periode, lus dans les agregats au lieu de rescanner l'historique
+
     def today(self, symbol=None):
-        t = datetime.now().replace(hour=0, minute=0, second=0)
-        return self.calc(t.timestamp(), symbol)
+        return self._current("day", symbol)
 
     def week(self, symbol=None):
-        now = datetime.now()
-        mon = now - timedelta(days=now.weekday())
-        t = mon.replace(hour=0, minute=0, second=0)
-        return self.calc(t.timestamp(), symbol)
+        return self._current("week", symbol)
 
     def month(self, symbol=None):
-        t = datetime.now().replace(day=1, hour=0, minute=0, second=0)
-        return self.calc(t.timestamp(), symbol)
+        return self._current("month", symbol)
+
+    def total(self, symbol=None):
+        return self._current("total", symbol)
 
     def format_all(self):
+        # Rapport memorise jusqu'au prochain trade ou changement de periode
+        now = time.time()
+        key = (len(self.results),) + tuple(period_start(p, now) for p in self.PERIODS)
+        if self._report and self._report[0] == key:
+            return self._report[1]
+        msg = self._format_all()
+        self._report = (key, msg)
+        return msg
+
+    def _format_all(self):
         d = self.today()
         w = self.week()
         m = self.month()
-        t = self.calc()
+        t = self.total()
 
         def fmt(s, label):
             sk = (f"{s['streak']}W" if s['streak'] > 0
@@ -466,75 +1975,471 @@ class Stats:
         msg += "━━━━━━━━━━━━━━━━━━━━━━━━━"
         return msg
 
-    def save(self):
+    def _save_totals(self, seq):
+        # Agregats "total" des trades du journal jusqu'a seq inclus
+        self.journal.save_totals(seq, {
+            "*" if sym is None else sym: agg.state()
+            for (period, sym), agg in self.aggs.items() if period == "total"})
+
+    def load(self, since=0):
+        # Trades depuis since (periodes du rapport) ; le total reprend les
+        # agregats enregistres et n'y ajoute que les trades plus recents
+        if not self.journal:
+            return
         try:
-            data = []
-            for r in self.results:
-                data.append({
-                    "time": r.signal_time,
-                    "dir": r.direction,
-                    "symbol": r.symbol,
-                    "win": r.is_win,
-                    "profit": r.profit,
-                    "expiry": r.expiry
-                })
-            with open("bot_stats.json", "w") as f:
-                json.dump(data, f)
-        except:
-            pass
+            self.journal.migrate("bot_stats.json")
+            seq, saved = self.journal.load_totals()
+            for key, state in saved.items():
+                self.aggs[("total", None if key == "*" else key)] = Aggregate.from_state(state)
+            last = seq
+            for d in self.journal.read(since, seq):
+                trade = trade_from_record(d)
+                if d["time"] >= since:
+                    self.results.append(trade)
+                    self._account(trade, total=False)
+                if d.get("seq", 0) > seq:
+                    self._account(trade, periods=False)
+                    last = max(last, d["seq"])
+            if last > seq:
+                self._save_totals(last)
+            # Totaux complets : reecrits a chaque compaction
+            self.journal.on_compact = self._save_totals
+            log.info("%d resultats charges", len(self.results))
+        except (OSError, ValueError, KeyError) as e:
+            log.error("Chargement stats: %s", e)
+
+# ============================================================
+#                  ENREGISTREMENT
+# ============================================================
+
+# Enregistrement binaire a largeur fixe : float64 (epoch, open, high, low,
+# close), meme format que les .bin du backtest. Chaque mise a jour d'une
+# bougie est ajoutee telle quelle ; a la lecture, la derniere version de
+# chaque epoch l'emporte.
+RECORD = struct.Struct("<5d")
+
+class Recorder:
+    # Un fichier par symbole, granularite et jour (UTC) :
+    # <dossier>/<SYMBOLE>_<granularite>_<AAAAMMJJ>.bin
+    # Ecritures tamponnees, videes a chaque nouvelle bougie.
+
+    def __init__(self, directory):
+        self.dir = directory
+        self.files = {}         # (symbole, granularite) -> [jour, fichier, epoch]
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, sym, gran, day):
+        stamp = time.strftime("%Y%m%d", time.gmtime(day * 86400))
+        return os.path.join(self.dir, f"{sym}_{gran}_{stamp}.bin")
+
+    def write(self, sym, gran, candle):
+        key = (sym, gran)
+        day = candle.time // 86400
+        cur = self.files.get(key)
+        if cur is None or cur[0] != day:
+            if cur is not None:
+                cur[1].close()
+            cur = self.files[key] = [day, open(self.path(sym, gran, day), "ab"), 0]
+            # Enregistrement incomplet (crash) : on realigne
+            extra = cur[1].tell() % RECORD.size
+            if extra:
+                cur[1].truncate(cur[1].tell() - extra)
+                cur[1].seek(0, os.SEEK_END)
+        elif candle.time != cur[2]:
+            cur[1].flush()
+        cur[2] = candle.time
+        cur[1].write(RECORD.pack(candle.time, candle.open, candle.high,
+                                 candle.low, candle.close))
+
+    def close(self):
+        for _, f, _ in self.files.values():
+            f.close()
+        self.files.clear()
+
+class CandleCache:
+    # Dernieres bougies closes par symbole et granularite, au format RECORD :
+    # <dossier>/<SYMBOLE>_<granularite>.bin. Une bougie ajoutee a chaque
+    # cloture ; reecriture atomique apres un historique ou quand le fichier
+    # depasse deux fois la taille du buffer.
+
+    def __init__(self, directory):
+        self.dir = directory
+        self.files = {}         # (symbole, granularite) -> [fichier, enregistrements]
+
+    def path(self, sym, gran):
+        return os.path.join(self.dir, f"{sym}_{gran}.bin")
+
+    def load(self, sym, gran, maxlen):
+        path = self.path(sym, gran)
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            data = f.read()
+        data = data[:len(data) - len(data) % RECORD.size]
+        bars = {}
+        for t, o, h, l, c in RECORD.iter_unpack(data):
+            bars[int(t)] = Candle(o, h, l, c, int(t))
+        return [bars[t] for t in sorted(bars)[-maxlen:]]
+
+    def closed(self, sym, gran, buf):
+        # Appele apres l'ajout d'une nouvelle bougie : buf[-2] est finale
+        if len(buf) < 2:
+            return
+        cur = self.files.get((sym, gran))
+        if cur is None:
+            os.makedirs(self.dir, exist_ok=True)
+            cur = self.files[(sym, gran)] = [open(self.path(sym, gran), "ab"), 0]
+            cur[1] = cur[0].tell() // RECORD.size
+        if cur[1] >= 2 * buf.maxlen:
+            self.save(sym, gran, buf)
+            return
+        x = buf[-2]
+        cur[0].write(RECORD.pack(x.time, x.open, x.high, x.low, x.close))
+        cur[0].flush()
+        cur[1] += 1
+
+    def save(self, sym, gran, buf):
+        # Toutes les bougies closes du buffer (la derniere est en cours)
+        cur = self.files.pop((sym, gran), None)
+        if cur is not None:
+            cur[0].close()
+        os.makedirs(self.dir, exist_ok=True)
+        path = self.path(sym, gran)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(RECORD.pack(x.time, x.open, x.high, x.low, x.close)
+                             for x in buf[:-1]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+class ZoneStore:
+    # Snapshot des zones de tous les symboles, ecrit atomiquement (fichier
+    # temporaire + fsync + rename) depuis un thread : un snapshot plus
+    # ancien que le dernier ecrit est ignore.
+
+    def __init__(self, path):
+        self.path  = path
+        self.lock  = threading.Lock()
+        self.seq   = 0
+        self.saved = 0
+
+    def save(self, snap, seq):
+        with self.lock:
+            if seq <= self.saved:
+                return
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(snap, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.saved = seq
 
     def load(self):
+        if not os.path.exists(self.path):
+            return {}
         try:
-            if not os.path.exists("bot_stats.json"):
-                return
-            with open("bot_stats.json", "r") as f:
-                data = json.load(f)
-            for d in data:
-                t = Trade(d["time"], d["dir"], d["symbol"],
-                          0, CONFIG["stake"], d.get("expiry", 5))
-                t.is_win = d["win"]
-                t.profit = d["profit"]
-                self.results.append(t)
-            log.info("%d resultats charges", len(self.results))
-        except:
-            pass
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except ValueError:
+            log.warning("Snapshot des zones illisible: %s", self.path)
+            return {}
+
+# ============================================================
+#                  CONNEXION
+# ============================================================
+
+class ApiError(Exception):
+    def __init__(self, data):
+        err = data.get("error", {})
+        super().__init__(err.get("message", "erreur API"))
+        self.code = err.get("code", "")
+        self.data = data
+
+class RequestTimeout(ConnectionError):
+    # Pas de reponse dans le delai : la requete a pu aboutir cote serveur
+    pass
+
+class Inbox:
+    # File bornee entre la lecture du websocket et les handlers. Les mises
+    # a jour ohlc en attente d'une meme bougie (symbole, granularite,
+    # open_time) sont fusionnees : seule la derniere est traitee, a sa
+    # place dans l'ordre d'arrivee. La premiere mise a jour d'une nouvelle
+    # bougie ne remplace jamais la derniere de la precedente (sa version
+    # finale), et les autres messages ne sont jamais fusionnes.
+    # File pleine : la lecture attend (contre-pression sur la socket).
+
+    def __init__(self, maxsize):
+        self.maxsize   = maxsize
+        self.queue     = deque()    # [message], None une fois remplace ou lu
+        self.slots     = {}         # (symbole, granularite) -> (open_time, entree)
+        self.depth     = 0          # messages encore a traiter
+        self.ready     = asyncio.Event()
+        self.space     = asyncio.Event()
+
+    def __len__(self):
+        return self.depth
+
+    async def put(self, data):
+        METRICS.inc("lz_inbox_received_total")
+        ohlc = data.get("ohlc") if data.get("msg_type") == "ohlc" else None
+        if ohlc is not None:
+            key = (ohlc.get("symbol"), ohlc.get("granularity"))
+            slot = self.slots.get(key)
+            if slot and slot[0] == ohlc.get("open_time") and slot[1][0] is not None:
+                slot[1][0] = None
+                self.depth -= 1
+                METRICS.inc("lz_inbox_coalesced_total")
+        while self.depth >= self.maxsize:
+            self.space.clear()
+            await self.space.wait()
+        entry = [data]
+        self.queue.append(entry)
+        if ohlc is not None:
+            self.slots[key] = (ohlc.get("open_time"), entry)
+        self.depth += 1
+        METRICS.peak("lz_inbox_depth_max", self.depth)
+        self.ready.set()
+
+    async def get(self):
+        while True:
+            while not self.queue:
+                self.ready.clear()
+                await self.ready.wait()
+            entry = self.queue.popleft()
+            data = entry[0]
+            if data is None:
+                continue
+            entry[0] = None
+            self.depth -= 1
+            self.space.set()
+            return data
+
+class TokenBucket:
+    # `rate` jetons par minute, au plus `burst` en reserve
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst):
+        self.rate   = rate / 60
+        self.burst  = burst
+        self.tokens = float(burst)
+        self.stamp  = time.monotonic()
+
+    def delay(self, now):
+        # 0 si un jeton est disponible, sinon secondes avant le prochain
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+class Connection:
+    # Websocket asyncio. send() range le message dans la file de sa classe ;
+    # une seule tache envoie, classe la plus prioritaire d'abord, dans la
+    # limite du seau de jetons de chaque classe. request() numerote le
+    # message (req_id) et renvoie un future resolu par la reponse
+    # correspondante (ApiError si erreur, RequestTimeout sans reponse).
+
+    CLASSES = ("control", "buy", "contract", "forget", "history")
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.req_id = 0
+        self.waiting = {}       # req_id -> future
+        self.queues = {c: deque() for c in self.CLASSES}   # (heure, message)
+        self.buckets = {c: TokenBucket(*v) for c, v in CONFIG["rate_limits"].items()}
+        self.wake = asyncio.Event()
+        self.flushing = False
+        self.flusher = None     # tache d'envoi en cours (reference gardee)
+
+    @staticmethod
+    def classify(msg):
+        if "buy" in msg:
+            return "buy"
+        if "proposal_open_contract" in msg or "proposal" in msg:
+            return "contract"
+        if "forget" in msg:
+            return "forget"
+        if "ticks_history" in msg or "ticks" in msg:
+            return "history"
+        return "control"       # authorize, time... : ni file ni limite
+
+    def send(self, msg):
+        self.queues[self.classify(msg)].append((time.monotonic(), json.dumps(msg)))
+        self.wake.set()
+        if not self.flushing:
+            self.flushing = True
+            self.flusher = asyncio.get_running_loop().create_task(self._flush())
+            self.flusher.add_done_callback(self._flushed)
+
+    def request(self, msg, timeout=None):
+        self.req_id += 1
+        req_id = msg["req_id"] = self.req_id
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.waiting[req_id] = fut
+        timer = loop.call_later(timeout or CONFIG["request_timeout"], self._expire, req_id)
+        fut.add_done_callback(lambda f: timer.cancel())
+        self.send(msg)
+        return fut
+
+    def _expire(self, req_id):
+        # Reponse tardive eventuelle : traitee comme un message non attendu
+        fut = self.waiting.pop(req_id, None)
+        if fut is not None and not fut.done():
+            fut.set_exception(RequestTimeout(f"pas de reponse (req_id {req_id})"))
+
+    def resolve(self, data):
+        # Premiere reponse a une requete en attente. Les messages suivants
+        # d'un abonnement (meme req_id) ne sont pas consommes.
+        fut = self.waiting.pop(data.get("req_id"), None)
+        if fut is None:
+            return False
+        if not fut.done():
+            if "error" in data:
+                fut.set_exception(ApiError(data))
+            else:
+                fut.set_result(data)
+        return True
+
+    def _next(self):
+        # (classe, message) a envoyer, ou delai avant le prochain jeton
+        now = time.monotonic()
+        wait = None
+        for cls in self.CLASSES:
+            queue = self.queues[cls]
+            if not queue:
+                continue
+            bucket = self.buckets.get(cls)
+            delay = bucket.delay(now) if bucket else 0.0
+            if delay == 0.0:
+                if bucket:
+                    bucket.tokens -= 1
+                stamp, message = queue.popleft()
+                METRICS.observe("lz_send_wait_seconds", now - stamp, cls)
+                return message
+            if wait is None or delay < wait:
+                wait = delay
+        return wait
+
+    async def _flush(self):
+        try:
+            while True:
+                item = self._next()
+                if item is None:
+                    break
+                if isinstance(item, str):
+                    await self.ws.send(item)
+                    continue
+                # Classes en attente de jetons : un envoi plus prioritaire
+                # peut arriver entre-temps
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), item)
+                except asyncio.TimeoutError:
+                    pass
+        except websockets.ConnectionClosed:
+            for queue in self.queues.values():
+                queue.clear()
+        finally:
+            self.flushing = False
+
+    def _flushed(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Envoi interrompu: %s", task.exception())
+
+    def pending(self):
+        return sum(len(q) for q in self.queues.values())
+
+    def close(self):
+        for fut in self.waiting.values():
+            if not fut.done():
+                fut.set_exception(ConnectionError("deconnecte"))
+        self.waiting.clear()
+        for queue in self.queues.values():
+            queue.clear()
 
 # ============================================================
 #                  BOT PRINCIPAL
 # ============================================================
 
 class TradingBot:
-    def __init__(self):
-        self.ws = None
+    GAP_INCR = 96       # trou M15 max traite en incremental (au-dela : recalcul)
+    ZONE_THREADS = True # zones calculees hors de la boucle (False : sur place)
+
+    def __init__(self, stats=None):
+        self.conn = None
+        self.inbox = None
+        self.tasks = set()
+        self.notify = True      # messages Telegram (desactive en backtest)
         self.authorized = False
         self.symbols = list(CONFIG["instruments"].keys())
 
         self.m15 = {}
         self.m1  = {}
-        self.zones = {}
+        self.zwork = {}         # symbole -> {granularite: ZoneWorker}
+        self.zbars = {}         # symbole -> {granularite: bougies des zones}
+        self.rollup = {}        # symbole -> BarBuilder des zones au-dela de M15
         self.last_sig = {}
+        self.m1_done  = {}      # derniere M1 close evaluee
+        self.m1_close = {}      # (M1 en cours, heure locale estimee de cloture)
+        self.m1_timer = {}      # cloture programmee (TimerHandle)
+        self.last_close = {}    # (chemin, heure locale de cloture) de la M1 evaluee
         self.m15_ok = {}
         self.m1_ok  = {}
+        self.builders = {}      # symbole -> BarBuilder (tick_bars)
+        self.held   = {}        # symbole -> {granularite: bougies des ticks avant l'historique}
+        self.extra  = {}        # symbole -> {granularite: CandleBuffer} hors M1/M15
+
+        self.zd = ZoneDetector()
 
         for sym in self.symbols:
-            self.m15[sym]      = deque(maxlen=CONFIG["m15_bars"])
-            self.m1[sym]       = deque(maxlen=500)
-            self.zones[sym]    = []
+            self.m15[sym]      = CandleBuffer(CONFIG["m15_bars"])
+            self.m1[sym]       = CandleBuffer(500)
+            self.zbars[sym]    = {900: self.m15[sym]}
+            self.zwork[sym]    = {}
+            for gran in sorted({900, *CONFIG["zone_timeframes"]}):
+                if gran != 900:
+                    self.zbars[sym][gran] = CandleBuffer(CONFIG["m15_bars"] * 900 // gran)
+                name = sym if gran == 900 else f"{sym} {tf_name(gran)}"
+                self.zwork[sym][gran] = ZoneWorker(self.zd,
+                                                   name if self.ZONE_THREADS else None,
+                                                   self._save_zones)
+            self.rollup[sym]   = BarBuilder([g for g in self.zbars[sym] if g != 900])
             self.last_sig[sym] = 0
+            self.m1_done[sym]  = 0
             self.m15_ok[sym]   = False
             self.m1_ok[sym]    = False
-
-        self.pending_trades = {}
-        self._req_id = 0
-        self.open_trades = {}
-
-        self.stats = Stats()
-        self.stats.load()
+            self.extra[sym]    = {g: CandleBuffer(500) for g in CONFIG["timeframes"]
+                                  if g not in (60, 900)}
+
+        self.pending_trades = set()     # achats envoyes, reponse attendue
+        self.open_trades = {}           # contract_id -> Trade, resultat attendu
+        self.unconfirmed = []           # achats sans reponse (passes ou non)
+        self.watch_all   = False        # abonnement a tous les contrats ouverts
+        self.reconciling = False
+        self.local       = {}           # contract_id -> suivi local (local_settle)
+        self.confirm     = None         # bilan groupe programme (TimerHandle)
+
+        if stats is None:
+            stats = Stats(CONFIG["stats_file"])
+            # Trades de la semaine et du mois en cours ; total enregistre a part
+            now = time.time()
+            stats.load(min(period_start("week", now), period_start("month", now)))
+        self.stats = stats
+        self.stats_pool = ThreadPoolExecutor(1, thread_name_prefix="stats")
+        self.recorder = Recorder(CONFIG["record_dir"]) if CONFIG["record_dir"] else None
+        self.cache    = CandleCache(CONFIG["cache_dir"]) if CONFIG["cache_dir"] else None
+        self.zstore   = ZoneStore(CONFIG["zone_file"]) if CONFIG["zone_file"] else None
+        self.zsnap    = {}      # snapshot charge, pas encore applique
         self.daily_profit = 0
         self.daily_trades = 0
         self.last_day = datetime.now().day
+        self.armed   = {}           # symbole -> proposition pre-abonnee
+        self.metrics_server = None  # endpoint /metrics (metrics_port)
 
-        self.zd = ZoneDetector()
+    def _now(self):
+        # Horloge des regles de trading (remplacee par l'heure des bougies en backtest)
+        return time.time()
 
     def run(self):
         log.info("LZ Trading Bot v2.1 demarre")
@@ -566,56 +2471,245 @@ class TradingBot:
             f"⚡ Trades simultanes: OUI"
         )
 
-        url = (f"wss://ws.binaryws.com/websockets/v3"
-               f"?app_id={CONFIG['deriv_app_id']}")
+        METRICS.on = CONFIG["metrics"]
+        asyncio.run(self._main())
+
+    async def _main(self):
+        if METRICS.on and CONFIG["metrics_port"]:
+            self.metrics_server = await asyncio.start_server(
+                self._serve_metrics, CONFIG["metrics_host"], CONFIG["metrics_port"])
+            log.info("Metriques sur http://%s:%d/metrics",
+                     CONFIG["metrics_host"], CONFIG["metrics_port"])
+        await self._offload(self._warm)
+        for sym in self.symbols:
+            if self.m15[sym]:
+                await self._load_zones(sym)
+                log.info("%s | cache: %d M15, %d M1 | %d zones",
+                         CONFIG["instruments"][sym]["name"], len(self.m15[sym]),
+                         len(self.m1[sym]), len(self.zwork[sym][900].view.zones))
+        url = f"{CONFIG['deriv_url']}?app_id={CONFIG['deriv_app_id']}"
 
         while True:
             try:
-                self.ws = websocket.WebSocketApp(
-                    url,
-                    on_open=self._on_open,
-                    on_message=self._on_msg,
-                    on_error=self._on_err,
-                    on_close=self._on_close
-                )
-                self.ws.run_forever(ping_interval=30,
-                                    ping_timeout=10)
+                async with websockets.connect(url, ping_interval=30,
+                                              ping_timeout=10,
+                                              max_size=None) as ws:
+                    await self._session(ws)
             except Exception as e:
                 log.error("WS loop error: %s", e)
 
             log.info("Reconnexion dans 5s...")
-            time.sleep(5)
+            await asyncio.sleep(5)
+
+    async def _session(self, ws):
+        # Lecture des trames sans jamais attendre un handler : les reponses
+        # attendues resolvent leur future, le reste passe par la file
+        # (Inbox) traitee dans l'ordre par _dispatch.
+        log.info("Connecte a Deriv")
+        self.conn = Connection(ws)
+        self.inbox = Inbox(CONFIG["inbox_size"])
+        dispatch = asyncio.create_task(self._dispatch())
+        report = asyncio.create_task(self._report())
+        watchdog = asyncio.create_task(self._watchdog())
+        self._spawn(self._login())
+        try:
+            async for message in ws:
+                t0 = time.perf_counter()
+                try:
+                    data = json.loads(message)
+                except ValueError as e:
+                    log.error("Message parse error: %s", e)
+                    continue
+                METRICS.observe("lz_decode_seconds", time.perf_counter() - t0,
+                                data.get("msg_type", ""))
+                if not self.conn.resolve(data):
+                    await self.inbox.put(data)
+        finally:
+            dispatch.cancel()
+            report.cancel()
+            watchdog.cancel()
+            for handle in self.m1_timer.values():
+                handle.cancel()
+            self.m1_timer.clear()
+            if self.confirm:
+                self.confirm.cancel()
+                self.confirm = None
+            self.conn.close()
+            self._on_close(ws.close_code)
+
+    def _spawn(self, coro):
+        # Garde une reference sur la tache jusqu'a sa fin
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _offload(self, fn, *args):
+        # Calcul lourd / E-S disque hors de la boucle
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _warm(self):
+        # Bougies du cache disque : zones pretes avant la connexion, seul le
+        # trou depuis la derniere bougie sera demande
+        if self.zstore:
+            self.zsnap = self.zstore.load()
+        if not self.cache:
+            return
+        for sym in self.symbols:
+            for gran, buf in ((900, self.m15[sym]), (60, self.m1[sym])):
+                for candle in self.cache.load(sym, gran, buf.maxlen):
+                    buf.append(candle)
 
-    def _on_open(self, ws):
-        log.info("Connecte a Deriv (on_open)")
-        ws.send(json.dumps({"authorize": CONFIG["deriv_token"]}))
+    async def _load_zones(self, sym):
+        # Recalcul complet de chaque granularite (bougies H1/H4 reagregees
+        # depuis les M15) ; touches du snapshot une seule fois par jeu de
+        # zones, ensuite elles suivent les zones en memoire
+        self._roll_reset(sym)
+        for gran, work in self.zwork[sym].items():
+            key = self._zkey(sym, gran)
+            snap = self.zsnap.get(key)
+            n = await work.reset(self.zbars[sym][gran], snap)
+            if n is None:
+                continue
+            del self.zsnap[key]
+            log.info("%s | %s touches reprises sur %d/%d zones (snapshot %s)",
+                     CONFIG["instruments"][sym]["name"], tf_name(gran), n,
+                     len(snap["zones"]),
+                     datetime.fromtimestamp(snap["last_time"]).strftime("%Y-%m-%d %H:%M"))
 
-    def _on_err(self, ws, error):
-        log.error("WS error: %s", error)
+    @staticmethod
+    def _zkey(sym, gran):
+        # Cle du snapshot (M15 : le symbole seul, comme les snapshots existants)
+        return sym if gran == 900 else f"{sym}_{gran}"
 
-    def _on_close(self, ws, code, msg):
+    def _save_zones(self):
+        if not self.zstore:
+            return
+        snap = {self._zkey(sym, gran): work.view.snapshot()
+                for sym in self.symbols
+                for gran, work in self.zwork[sym].items() if work.view.ready}
+        # Snapshots pas encore appliques (symbole sans historique) conserves
+        for sym, old in self.zsnap.items():
+            snap.setdefault(sym, old)
+        self.zstore.seq += 1
+        self._spawn(self._offload(self.zstore.save, snap, self.zstore.seq))
+
+    def _on_close(self, code):
         log.info("Deconnecte (%s)", code)
         self.authorized = False
+        self.builders.clear()
+        self.held.clear()
+        for sym in self.symbols:
+            # Buffers a recompleter par l'historique avant tout signal
+            self.m1_ok[sym] = self.m15_ok[sym] = False
+        self.armed.clear()      # abonnements morts avec la socket
+        self.watch_all = False
 
-    def _on_msg(self, ws, message):
+    async def _login(self):
+        # Heure serveur dans le meme envoi : borne des historiques
         try:
-            data = json.loads(message)
-            if "error" in data:
-                log.error("API error: %s", data["error"]["message"])
-                return
+            data, now = await asyncio.gather(
+                self.conn.request({"authorize": CONFIG["deriv_token"]}),
+                self.conn.request({"time": 1}))
+        except (ApiError, ConnectionError) as e:
+            log.error("API error: %s", e)
+            return
+        self._auth(data, int(now["time"]))
 
-            mt = data.get("msg_type", "")
+    async def _dispatch(self):
+        while True:
+            data = await self.inbox.get()
+            t0 = time.perf_counter()
+            try:
+                await self._on_msg(data)
+            except Exception as e:
+                log.error("Message error: %s", e)
+            METRICS.observe("lz_handle_seconds", time.perf_counter() - t0,
+                            data.get("msg_type", ""))
 
-            if mt == "authorize":       self._auth(data)
-            elif mt == "candles":       self._hist(data)
-            elif mt == "ohlc":          self._ohlc(data)
-            elif mt == "buy":           self._bought(data)
-            elif mt == "proposal_open_contract": self._contract(data)
+    async def _report(self):
+        while True:
+            await asyncio.sleep(CONFIG["inbox_report"])
+            self._sample()
+            for line in METRICS.summary():
+                log.info("Metriques: %s", line)
+
+    def _sample(self):
+        # Jauges lues a la demande (bilan periodique, /metrics)
+        if self.inbox is not None:
+            METRICS.set("lz_inbox_depth", len(self.inbox))
+        if self.conn is not None:
+            METRICS.set("lz_send_pending", self.conn.pending())
+
+    async def _serve_metrics(self, reader, writer):
+        # GET /metrics (HTTP/1.0 minimal, une requete par connexion)
+        try:
+            line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass            # en-tetes ignores
+            parts = line.split()
+            if len(parts) > 1 and parts[1] == b"/metrics":
+                self._sample()
+                status, body = "200 OK", METRICS.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(f"HTTP/1.0 {status}\r\n"
+                         f"Content-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _arm_close(self, sym, candle, epoch):
+        # Cloture de la M1 en cours en heure locale, d'apres l'heure serveur
+        # (epoch) du dernier ohlc : jamais en avance, en retard au plus du
+        # delai reseau. Programmee une fois par bougie.
+        close = time.time() + candle.time + 60 - epoch
+        self.m1_close[sym] = (candle.time, close)
+        if sym not in self.m1_timer:
+            self._schedule_close(sym, close)
+
+    def _schedule_close(self, sym, close):
+        loop = asyncio.get_running_loop()
+        delay = close + CONFIG["close_grace"] - time.time()
+        self.m1_timer[sym] = loop.call_later(max(delay, 0), self._close_due, sym)
+
+    def _close_due(self, sym):
+        # Bougie finalisee depuis son dernier ohlc et evaluee aussitot ; le
+        # premier ohlc de la suivante ne la reevalue pas (m1_done)
+        del self.m1_timer[sym]
+        buf = self.m1[sym]
+        bar, close = self.m1_close.get(sym, (0, 0))
+        if not buf or buf[-1].time != bar or bar == self.m1_done[sym]:
+            return
+        if time.time() < close + CONFIG["close_grace"]:
+            self._schedule_close(sym, close)     # estimation repoussee
+            return
+        if self.m1_ok[sym] and self.m15_ok[sym] and len(buf) >= 3:
+            buf.seal_last()
+            self._check_signal(sym, buf, "timer")
+
+    async def _on_msg(self, data):
+        if "error" in data:
+            # Les erreurs des requetes arrivent a leur future (req_id) :
+            # ici, envois sans reponse attendue ou reponses tardives
+            METRICS.inc("lz_api_errors_total", data.get("msg_type", ""))
+            if data.get("msg_type") != "forget":    # abonnement deja termine
+                log.error("API error (%s): %s", data.get("msg_type", "?"),
+                          data["error"]["message"])
+            return
+
+        mt = data.get("msg_type", "")
 
-        except Exception as e:
-            log.error("Message parse error: %s", e)
+        if mt == "candles":         await self._hist(data)
+        elif mt == "tick":          self._tick(data)
+        elif mt == "ohlc":          self._ohlc(data)
+        elif mt == "proposal_open_contract": await self._contract(data)
+        elif mt == "proposal":      self._proposal(data)
 
-    def _auth(self, data):
+    def _auth(self, data, end_ts):
         info = data["authorize"]
         log.info("Compte: %s | Solde: %.2f $", info["fullname"], info["balance"])
         self.authorized = True
@@ -624,32 +2718,44 @@ class TradingBot:
                  f"Compte: {info['fullname']}\n"
                  f"Solde: {info['balance']}$")
 
-        end_ts = int(time.time())
-        log.info("Demande historique: end=%d", end_ts)
+        missing = 0
+        ticks = CONFIG["tick_bars"]
 
         for sym in self.symbols:
-            # M15
-            start_ts_m15 = end_ts - (CONFIG["m15_bars"] * 900)
-            self.ws.send(json.dumps({
-                "ticks_history": sym,
-                "style": "candles",
-                "granularity": 900,
-                "start": start_ts_m15,
-                "end": end_ts,
-                "subscribe": 1
-            }))
-            # M1
-            start_ts_m1 = end_ts - (200 * 60)
-            self.ws.send(json.dumps({
-                "ticks_history": sym,
-                "style": "candles",
-                "granularity": 60,
-                "start": start_ts_m1,
-                "end": end_ts,
-                "subscribe": 1
-            }))
-
-    def _hist(self, data):
+            for gran, buf, bars in ((900, self.m15[sym], CONFIG["m15_bars"]),
+                                    (60, self.m1[sym], 200)):
+                # Seulement depuis la derniere bougie connue (remplacee),
+                # tout l'historique si le trou depasse la fenetre
+                start = end_ts - bars * gran
+                if buf and buf[-1].time > start:
+                    start = buf[-1].time
+                elif buf:
+                    buf.clear()
+                missing += (end_ts - start) // gran
+                req = {
+                    "ticks_history": sym,
+                    "style": "candles",
+                    "granularity": gran,
+                    "start": start,
+                    "end": end_ts,
+                }
+                if not ticks:
+                    req["subscribe"] = 1
+                self.conn.send(req)
+            if ticks:
+                # Un seul flux par symbole ; bougies en cours reprises de zero.
+                # M1/M15 des ticks retenues jusqu'a la reponse de l'historique
+                self.builders[sym] = BarBuilder(CONFIG["timeframes"])
+                self.held[sym] = {900: [], 60: []}
+                self.conn.send({"ticks": sym, "subscribe": 1})
+
+        log.info("Demande historique: end=%d (%d bougies)", end_ts, missing)
+
+        if self.open_trades or self.unconfirmed:
+            # Abonnements aux contrats morts avec l'ancienne socket
+            self._spawn(self._reconcile())
+
+    async def _hist(self, data):
         req  = data.get("echo_req", {})
         sym  = req.get("ticks_history", "")
         gran = req.get("granularity", 60)
@@ -658,39 +2764,77 @@ class TradingBot:
             return
 
         candles_data = data.get("candles", [])
-        if not candles_data:
+        held = self.held.get(sym, {}).pop(int(gran), [])
+        if not candles_data and not held:
             return
 
         info = CONFIG["instruments"][sym]
 
         if gran == 900 or str(gran) == "900":
-            # M15
+            # M15 : fusion par epoch avec le buffer (cache ou reconnexion)
+            buf = self.m15[sym]
+            last = buf[-1].time if buf else 0
+            fresh = []
             for c in candles_data:
                 candle = Candle(
                     float(c["open"]), float(c["high"]),
                     float(c["low"]),  float(c["close"]),
                     int(c["epoch"])
                 )
-                self.m15[sym].append(candle)
+                if self.recorder:
+                    self.recorder.write(sym, 900, candle)
+                if candle.time >= last:
+                    fresh.append(candle)
+            fresh = self._merge_held(fresh, held, last)
+
+            if buf and self.zwork[sym][900].view.ready and len(fresh) <= self.GAP_INCR:
+                # Petit trou : zones mises a jour bougie par bougie
+                for candle in fresh:
+                    self._m15_bar(sym, candle)
+            else:
+                for candle in fresh:
+                    if buf and candle.time == buf[-1].time:
+                        buf[-1] = candle
+                    else:
+                        buf.append(candle)
+                await self._load_zones(sym)
+            if self.cache:
+                self.cache.save(sym, 900, buf)
+            if sym in self.builders and buf:
+                self.builders[sym].seed(900, buf[-1])
 
             self.m15_ok[sym] = True
-            self.zones[sym] = self.zd.compute_zones(self.m15[sym])
-            act = sum(1 for z in self.zones[sym] if z.broken_time == 0)
-            log.info("%s | %d zones (%d actives)", info["name"], len(self.zones[sym]), act)
+            sets = []
+            for gran, work in self.zwork[sym].items():
+                zones = work.view.zones
+                act = sum(1 for z in zones if z.broken_time == 0)
+                sets.append(f"{tf_name(gran)} {len(zones)} zones ({act} actives)")
+            log.info("%s | %s | +%d M15", info["name"], ", ".join(sets), len(fresh))
 
         elif gran == 60 or str(gran) == "60":
             # M1
             buf = self.m1[sym]
+            fresh = []
             for c in candles_data:
                 candle = Candle(
                     float(c["open"]), float(c["high"]),
                     float(c["low"]),  float(c["close"]),
                     int(c["epoch"])
                 )
+                if self.recorder:
+                    self.recorder.write(sym, 60, candle)
+                fresh.append(candle)
+            for candle in self._merge_held(fresh, held, 0):
+                if buf and candle.time < buf[-1].time:
+                    continue
                 if buf and candle.time == buf[-1].time:
                     buf[-1] = candle
                 else:
                     buf.append(candle)
+            if self.cache:
+                self.cache.save(sym, 60, buf)
+            if sym in self.builders and buf:
+                self.builders[sym].seed(60, buf[-1])
 
             if len(buf) >= 50 and not self.m1_ok[sym]:
                 self.m1_ok[sym] = True
@@ -709,72 +2853,216 @@ class TradingBot:
         candle = Candle(float(ohlc["open"]), float(ohlc["high"]),
                        float(ohlc["low"]), float(ohlc["close"]),
                        int(ohlc["open_time"]))
+        self._bar(sym, gran, candle, int(ohlc.get("epoch", 0)))
+
+    def _tick(self, data):
+        tick = data.get("tick", {})
+        builder = self.builders.get(tick.get("symbol"))
+        if builder is None:
+            return
+        sym = tick["symbol"]
+        epoch = int(tick["epoch"])
+        held = self.held.get(sym, {})
+        for gran, candle, closed in builder.add(epoch, float(tick["quote"])):
+            if gran in held:
+                self._hold(sym, gran, candle, epoch, held[gran])
+            elif closed:
+                self._bar_closed(sym, gran, candle)
+            else:
+                self._bar(sym, gran, candle, epoch, "tick")
+
+    def _hold(self, sym, gran, candle, epoch, bars):
+        # Historique pas encore recu : la bougie n'est pas ajoutee au buffer
+        # (elle masquerait le trou), elle y sera fusionnee par _hist
+        if bars and bars[-1].time == candle.time:
+            bars[-1] = candle
+        else:
+            bars.append(candle)
+        if self.recorder:
+            self.recorder.write(sym, gran, candle)
+        if gran == 60 and self.local and epoch:
+            self._spot(sym, epoch, candle.close)
+
+    @staticmethod
+    def _merge_held(fresh, held, last):
+        # Bougies de l'historique puis celles des ticks retenues, par epoch ;
+        # a epoch egal, ouverture et extremes d'avant le premier tick gardes
+        for bar in held:
+            if fresh and bar.time == fresh[-1].time:
+                old = fresh[-1]
+                fresh[-1] = Candle(old.open, max(old.high, bar.high),
+                                   min(old.low, bar.low), bar.close, bar.time)
+            elif bar.time >= last and (not fresh or bar.time > fresh[-1].time):
+                fresh.append(bar)
+        return fresh
+
+    def _bar(self, sym, gran, candle, epoch, via="ohlc"):
+        # Nouvelle version de la bougie en cours (ohlc serveur ou ticks)
+        if self.recorder:
+            self.recorder.write(sym, gran, candle)
 
         if gran == 900:
-            buf = self.m15[sym]
-            if buf and candle.time != buf[-1].time:
-                buf.append(candle)
-                self.zones[sym] = self.zd.compute_zones(buf)
-            elif buf:
-                buf[-1] = candle
+            self._m15_bar(sym, candle)
         elif gran == 60:
             buf = self.m1[sym]
             if buf and candle.time != buf[-1].time:
                 buf.append(candle)
+                if self.cache:
+                    self.cache.closed(sym, 60, buf)
                 if self.m1_ok[sym] and self.m15_ok[sym] and len(buf) >= 4:
-                    self._check_signal(sym)
+                    self._check_signal(sym, via=via)
             elif buf:
                 buf[-1] = candle
+            if buf and CONFIG["close_timer"] and epoch:
+                self._arm_close(sym, candle, epoch)
+            if self.local and epoch:
+                self._spot(sym, epoch, candle.close)
+        elif gran in self.extra[sym]:
+            buf = self.extra[sym][gran]
+            if buf and candle.time == buf[-1].time:
+                buf[-1] = candle
+            else:
+                buf.append(candle)
 
-    def _check_signal(self, sym):
-        # Reset journalier
-        if datetime.now().day != self.last_day:
-            self.daily_profit = 0
-            self.daily_trades = 0
-            self.last_day = datetime.now().day
-            telegram("🔄 <b>Nouveau jour</b>\n\n" + self.stats.format_all())
-
-        # Conditions globales
-        if not self.m15_ok.get(sym) or not self.m1_ok.get(sym):
+    def _bar_closed(self, sym, gran, candle):
+        # Fin exacte d'une bougie construite depuis les ticks : la M1 est
+        # evaluee sans attendre l'ajout de la suivante
+        if gran != 60:
             return
-
-        if self.daily_trades >= CONFIG["max_trades_per_day"]:
+        buf = self.m1[sym]
+        if buf and buf[-1].time == candle.time and \
+                self.m1_ok[sym] and self.m15_ok[sym] and len(buf) >= 3:
+            buf.seal_last()
+            self._check_signal(sym, buf, "tick")
+
+    def _m15_bar(self, sym, candle):
+        buf = self.m15[sym]
+        if not buf:
             return
-
-        if self.daily_profit <= CONFIG["daily_stop_loss"]:
+        if candle.time != buf[-1].time:
+            buf.append(candle)
+            if self.cache:
+                self.cache.closed(sym, 900, buf)
+            self.zwork[sym][900].update(buf)
+        else:
+            buf[-1] = candle
+        if self.rollup[sym].grans:
+            self._roll(sym, candle)
+
+    def _roll(self, sym, candle, update=True):
+        # Bougies H1/H4 des zones agregees depuis la M15 recue ; le jeu de
+        # zones d'une granularite n'est recalcule qu'a l'ouverture de sa
+        # bougie suivante (comme les M15)
+        for gran, bar, closed in self.rollup[sym].add_bar(candle):
+            if closed:
+                continue        # derniere version deja ecrite
+            buf = self.zbars[sym][gran]
+            if buf and bar.time == buf[-1].time:
+                buf[-1] = bar
+            elif buf or bar.time >= self.m15[sym][0].time:
+                # Premiere bougie : seulement si complete
+                buf.append(bar)
+                if update:
+                    self.zwork[sym][gran].update(buf)
+
+    def _roll_reset(self, sym):
+        # Bougies H1/H4 reconstruites depuis tout le buffer M15 (recalcul complet)
+        grans = self.rollup[sym].grans
+        if not grans:
             return
+        self.rollup[sym] = BarBuilder(grans)
+        for gran in grans:
+            self.zbars[sym][gran].clear()
+        for candle in self.m15[sym]:
+            self._roll(sym, candle, update=False)
 
-        now = time.time()
-        last = self.last_sig.get(sym, 0)
-        if CONFIG["cooldown"] > 0 and now - last < CONFIG["cooldown"] * 60:
-            return
+    def _new_day(self, day):
+        self.daily_profit = 0
+        self.daily_trades = 0
+        self.last_day = day
+        if self.notify:
+            telegram("🔄 <b>Nouveau jour</b>\n\n" + self.stats.format_all(), low=True)
 
-        candles = list(self.m1[sym])
-        # Au moins 3 bougies clôturées + 1 en cours
-        if len(candles) < 4:
+    def _check_signal(self, sym, closed=None, via="ohlc"):
+        # closed : bougies closes (par defaut le buffer M1 sans la bougie
+        # en cours) ; via : chemin de detection de la cloture
+        now = self._now()
+
+        # Reset journalier
+        day = datetime.fromtimestamp(now).day
+        if day != self.last_day:
+            self._new_day(day)
+
+        # Conditions globales : pas de signal, proposition pre-abonnee rendue
+        if self._blocked(sym, now):
+            self._arm(sym, None)
             return
 
-        # On exclut la bougie en cours (dernière) et on travaille
-        # sur les bougies entièrement clôturées
-        candles_closed = candles[:-1]
-        current = candles_closed[-1]
+        if closed is None:
+            candles = self.m1[sym]
+            # Au moins 3 bougies clôturées + 1 en cours
+            if len(candles) < 4:
+                return
+            # On exclut la bougie en cours (dernière) et on travaille
+            # sur les bougies entièrement clôturées (fenêtre sans copie)
+            closed = candles[:-1]
+        current = closed[-1]
+
+        # Une seule evaluation par bougie (timer ou ohlc suivant)
+        if current.time == self.m1_done[sym]:
+            return
+        self.m1_done[sym] = current.time
+        bar, close = self.m1_close.get(sym, (0, 0))
+        self.last_close[sym] = (via, close if bar == current.time else 0)
 
-        zone = self.zd.find_zone(current, self.zones[sym], current.time)
+        zone, work = self._find_zone(sym, current)
+        self._arm(sym, zone)
         if zone is None:
             return
 
-        direction, pattern = Patterns.scan(candles_closed, zone.type)
+        direction, pattern = Patterns.scan(closed, zone.type)
         if direction == 0:
             return
 
         # SIGNAL: zone touchée + pattern valide (sur bougie clôturée)
-        zone.touch_count += 1
+        work.touch(zone)
         self.last_sig[sym] = now
+        METRICS.inc("lz_signals_total", sym)
         ctype = "CALL" if direction == 1 else "PUT"
         info = CONFIG["instruments"][sym]
         log.info("[SIGNAL] %s %s | Pattern=%s | Expiry=%d min",
                  ctype, info["name"], pattern, info["expiry"])
         self._trade(sym, ctype, current.close, pattern)
+        self._save_zones()
+
+    def _blocked(self, sym, now):
+        if not self.m15_ok.get(sym) or not self.m1_ok.get(sym):
+            return True
+
+        if self.daily_trades >= CONFIG["max_trades_per_day"]:
+            return True
+
+        if self.daily_profit <= CONFIG["daily_stop_loss"]:
+            return True
+
+        inflight = len(self.pending_trades) + len(self.open_trades) + len(self.unconfirmed)
+        if inflight >= CONFIG["max_inflight"]:
+            return True
+
+        last = self.last_sig.get(sym, 0)
+        return CONFIG["cooldown"] > 0 and now - last < CONFIG["cooldown"] * 60
+
+    @timed("lz_find_zone_seconds")
+    def _find_zone(self, sym, candle):
+        # (zone, worker) du premier jeu de zones touche, dans l'ordre de
+        # CONFIG["zone_timeframes"]
+        for gran in CONFIG["zone_timeframes"]:
+            work = self.zwork[sym][gran]
+            work.lag()
+            zone = work.find(candle, candle.time)
+            if zone is not None:
+                return zone, work
+        return None, None
 
     def _trade(self, sym, ctype, price, pattern):
         info = CONFIG["instruments"][sym]
@@ -782,19 +3070,8 @@ class TradingBot:
         trade = Trade(time.time(), ctype, sym, price, CONFIG["stake"], expiry)
         trade.pattern = pattern
 
-        self._req_id += 1
-        req_id = self._req_id
-        self.pending_trades[req_id] = trade
-
-        self.ws.send(json.dumps({
-            "buy": 1, "price": CONFIG["stake"],
-            "parameters": {
-                "contract_type": ctype, "currency": "USD",
-                "amount": CONFIG["stake"], "basis": "stake",
-                "symbol": sym, "duration": expiry, "duration_unit": "m"
-            },
-            "req_id": req_id
-        }))
+        self.pending_trades.add(trade)
+        self._spawn(self._buy(trade))
 
         emoji = "🟢" if ctype == "CALL" else "🔴"
         active = len(self.open_trades) + len(self.pending_trades)
@@ -803,39 +3080,328 @@ class TradingBot:
                  f"💵 Prix: {price}\n💰 Mise: {CONFIG['stake']}$\n"
                  f"⏱ Expiry: {expiry} min\n📊 Trades actifs: {active}")
 
-    def _bought(self, data):
-        buy = data.get("buy", {})
-        cid = buy.get("contract_id")
-        req_id = data.get("req_id")
-
-        if req_id in self.pending_trades and cid:
-            trade = self.pending_trades[req_id]
-            trade.contract_id = cid
-            self.open_trades[cid] = trade
-            self.daily_trades += 1
-            info = CONFIG["instruments"][trade.symbol]
-            log.info("Trade ouvert | %s | ID: %s", info["name"], cid)
-
-            self.ws.send(json.dumps({
-                "proposal_open_contract": 1,
-                "contract_id": cid, "subscribe": 1
-            }))
-            del self.pending_trades[req_id]
-
-    def _contract(self, data):
+    def _arm(self, sym, zone):
+        # Proposition abonnee dans le sens de la zone ou se trouve la
+        # derniere M1 close (seul cas ou la suivante peut donner un signal)
+        if not CONFIG["prearm"] or not self.authorized:
+            return
+        want = None if zone is None else ("CALL" if zone.type == 1 else "PUT")
+        cur = self.armed.get(sym)
+        if cur is not None and cur["dir"] == want:
+            return
+        if cur is not None:
+            self._disarm(sym)
+        if want:
+            self._spawn(self._subscribe_proposal(sym, want))
+
+    def _disarm(self, sym):
+        entry = self.armed.pop(sym, None)
+        if entry and entry["sub"]:
+            self.conn.send({"forget": entry["sub"]})
+
+    async def _subscribe_proposal(self, sym, ctype):
+        entry = {"dir": ctype, "id": None, "sub": None, "time": 0.0}
+        self.armed[sym] = entry
+        try:
+            data = await self.conn.request({
+                "proposal": 1, "subscribe": 1,
+                "contract_type": ctype, "currency": "USD",
+                "amount": CONFIG["stake"], "basis": "stake",
+                "symbol": sym, "duration": CONFIG["instruments"][sym]["expiry"],
+                "duration_unit": "m"
+            })
+        except (ApiError, ConnectionError) as e:
+            if self.armed.get(sym) is entry:
+                del self.armed[sym]
+            log.warning("Proposition refusee | %s %s : %s", sym, ctype, e)
+            return
+        sub = data.get("subscription", {}).get("id")
+        if self.armed.get(sym) is not entry:
+            # Desarmee (ou remplacee) pendant la requete
+            if sub:
+                self.conn.send({"forget": sub})
+            return
+        entry["id"]   = data["proposal"]["id"]
+        entry["sub"]  = sub
+        entry["time"] = time.time()
+
+    def _proposal(self, data):
+        # Mise a jour du flux : nouvel id, fraicheur
+        sub = data.get("subscription", {}).get("id")
+        sym = data.get("echo_req", {}).get("symbol")
+        entry = self.armed.get(sym)
+        if entry is None or entry["sub"] != sub:
+            return
+        entry["id"]   = data["proposal"]["id"]
+        entry["time"] = time.time()
+
+    def _take_proposal(self, trade):
+        # Proposition armee si elle correspond et est fraiche ; retiree des
+        # armees, son flux est oublie apres la reponse a l'achat
+        entry = self.armed.get(trade.symbol)
+        if entry is None or entry["dir"] != trade.direction or not entry["id"]:
+            return None
+        if time.time() - entry["time"] > CONFIG["proposal_max_age"]:
+            return None
+        return self.armed.pop(trade.symbol)
+
+    def _buy_request(self, trade, proposal=None):
+        if proposal:
+            return self.conn.request({"buy": proposal["id"], "price": CONFIG["stake"]})
+        return self.conn.request({
+            "buy": 1, "price": CONFIG["stake"],
+            "parameters": {
+                "contract_type": trade.direction, "currency": "USD",
+                "amount": CONFIG["stake"], "basis": "stake",
+                "symbol": trade.symbol, "duration": trade.expiry,
+                "duration_unit": "m"
+            }
+        })
+
+    async def _buy(self, trade):
+        proposal = self._take_proposal(trade)
+        req = self._buy_request(trade, proposal)
+        via, close = self.last_close.get(trade.symbol, ("ohlc", 0))
+        if close:
+            METRICS.observe("lz_close_to_buy_seconds", time.time() - close, via)
+        sent = time.perf_counter()
+        path = "proposition" if proposal else "direct"
+        try:
+            try:
+                data = await req
+            except ApiError as e:
+                if not proposal:
+                    raise
+                # Proposition expiree cote serveur : achat direct
+                log.warning("Achat par proposition refuse | %s : %s", trade.symbol, e)
+                path = "direct"
+                sent = time.perf_counter()
+                data = await self._buy_request(trade)
+        except ApiError as e:
+            log.error("Achat refuse | %s : %s", trade.symbol, e)
+            METRICS.inc("lz_buys_total", "refused")
+            return
+        except ConnectionError as e:
+            # L'achat a pu passer : retrouve (ou abandonne) au prochain bilan
+            log.warning("Achat sans reponse | %s : %s", trade.symbol, e)
+            METRICS.inc("lz_buys_total", "no_reply")
+            self.unconfirmed.append(trade)
+            return
+        finally:
+            self.pending_trades.discard(trade)
+            if proposal and proposal["sub"] and self.authorized:
+                self.conn.send({"forget": proposal["sub"]})
+        METRICS.observe("lz_signal_to_ack_seconds", time.time() - trade.signal_time, path)
+        METRICS.observe("lz_buy_ack_seconds", time.perf_counter() - sent, path)
+        METRICS.inc("lz_buys_total", "ok")
+        self._bought(trade, data)
+        if proposal and trade.symbol not in self.armed:
+            # La zone est toujours la : proposition suivante
+            self._spawn(self._subscribe_proposal(trade.symbol, trade.direction))
+
+    def _bought(self, trade, data):
+        cid = data.get("buy", {}).get("contract_id")
+        if not cid:
+            return
+        trade.contract_id = cid
+        self.open_trades[cid] = trade
+        self.daily_trades += 1
+        info = CONFIG["instruments"][trade.symbol]
+        log.info("Trade ouvert | %s | ID: %s", info["name"], cid)
+        if not CONFIG["local_settle"]:
+            self._spawn(self._watch(cid))
+            return
+        buy = data["buy"]
+        start = int(buy.get("start_time") or buy.get("purchase_time") or time.time())
+        price = float(buy.get("buy_price") or trade.stake)
+        self.local[cid] = {
+            "trade": trade, "start": start, "end": start + trade.expiry * 60,
+            "entry": None, "last": None, "price": price,
+            "payout": float(buy.get("payout") or price * (1 + CONFIG["payout"] / 100)),
+        }
+
+    def _spot(self, sym, epoch, quote):
+        # Prix du flux (heure serveur) : entree au premier prix apres le
+        # debut du contrat, sortie au dernier prix a l'expiration
+        for cid, c in list(self.local.items()):
+            if c["trade"].symbol != sym or epoch <= c["start"]:
+                continue
+            if c["entry"] is None:
+                c["entry"] = quote
+            if epoch < c["end"]:
+                c["last"] = quote
+                continue
+            del self.local[cid]
+            exit_spot = quote if epoch == c["end"] or c["last"] is None else c["last"]
+            self._provisional(c, exit_spot)
+
+    def _provisional(self, c, exit_spot):
+        trade = c["trade"]
+        if trade.direction == "CALL":
+            win = exit_spot > c["entry"]
+        else:
+            win = exit_spot < c["entry"]
+        profit = c["payout"] - c["price"] if win else -c["price"]
+        # Compte tout de suite dans les limites journalieres, corrige par
+        # le resultat officiel
+        trade.provisional = profit
+        self.daily_profit += profit
+        log.info("Resultat provisoire %s %+.2f $ | %s %s", "WIN" if win else "LOSS",
+                 profit, CONFIG["instruments"][trade.symbol]["name"], trade.direction)
+        self._confirm_later()
+
+    def _confirm_later(self):
+        # Un seul bilan pour les expirations rapprochees
+        if self.confirm is None:
+            self.confirm = asyncio.get_running_loop().call_later(
+                CONFIG["settle_confirm"], self._confirm)
+
+    def _confirm(self):
+        self.confirm = None
+        if self.reconciling:
+            self._confirm_later()
+        else:
+            self._spawn(self._reconcile())
+
+    async def _watch(self, cid=None):
+        # Abonnement au contrat (a tous les contrats ouverts si cid est
+        # None). La premiere reponse arrive par le req_id, erreur comprise ;
+        # sans suivi, le contrat est repris par _watchdog apres expiration.
+        msg = {"proposal_open_contract": 1, "subscribe": 1}
+        if cid:
+            msg["contract_id"] = cid
+        try:
+            data = await self.conn.request(msg)
+        except (ApiError, ConnectionError) as e:
+            log.warning("Suivi du contrat %s impossible : %s", cid or "(tous)", e)
+            if cid is None:
+                self.watch_all = False
+            return
+        await self._contract(data)
+
+    async def _contract(self, data):
         poc = data.get("proposal_open_contract", {})
         cid = poc.get("contract_id")
         if not poc.get("is_sold") or cid not in self.open_trades:
             return
 
-        trade = self.open_trades[cid]
-        profit = float(poc.get("profit", 0))
+        trade = self.open_trades.pop(cid)
+        sub_id = data.get("subscription", {}).get("id")
+        if sub_id and data.get("echo_req", {}).get("contract_id"):
+            self.conn.send({"forget": sub_id})
+        await self._result(trade, float(poc.get("profit", 0)),
+                           float(poc.get("sell_price", 0)))
+
+    async def _watchdog(self):
+        # Contrats sans resultat apres expiration + settle_grace, achats
+        # sans reponse : un bilan groupe pour tous
+        grace = CONFIG["settle_grace"]
+        while True:
+            await asyncio.sleep(grace / 2)
+            if not self.authorized:
+                continue
+            now = time.time()
+            late = any(now > t.signal_time + t.expiry * 60 + grace
+                       for t in self.open_trades.values())
+            if late or self.unconfirmed:
+                try:
+                    await self._reconcile()
+                except Exception as e:
+                    log.error("Bilan des contrats: %s", e)
+
+    async def _reconcile(self):
+        # Un seul aller-retour (portfolio + profit_table) : contrats vendus
+        # regles, contrats encore ouverts suivis par un seul abonnement,
+        # achats sans reponse retrouves ; abandon apres 5 x settle_grace
+        trades = list(self.open_trades.values()) + self.unconfirmed
+        if not trades or self.reconciling:
+            return
+        # Un seul bilan a la fois, reglements compris
+        self.reconciling = True
+        try:
+            await self._reconcile_trades(trades)
+        finally:
+            self.reconciling = False
+
+    async def _reconcile_trades(self, trades):
+        since = int(min(t.signal_time for t in trades)) - 60
+        try:
+            port, table = await asyncio.gather(
+                self.conn.request({"portfolio": 1}),
+                self.conn.request({"profit_table": 1, "description": 1,
+                                   "date_from": since, "limit": 500}))
+        except (ApiError, ConnectionError) as e:
+            log.warning("Bilan des contrats impossible : %s", e)
+            return
+        live = {c["contract_id"]: c for c in port["portfolio"].get("contracts", [])}
+        sold = {t["contract_id"]: t for t in table["profit_table"].get("transactions", [])}
+
+        # Achats sans reponse : contrat inconnu, meme symbole et sens,
+        # achete apres le signal
+        known = set(self.open_trades)
+        for trade in list(self.unconfirmed):
+            for cid, c in (*live.items(), *sold.items()):
+                sym = c.get("symbol") or c.get("underlying_symbol")
+                if cid in known or sym != trade.symbol or \
+                        c.get("contract_type") != trade.direction or \
+                        c.get("purchase_time", 0) < trade.signal_time - 5:
+                    continue
+                known.add(cid)
+                self.unconfirmed.remove(trade)
+                self._bought(trade, {"buy": {"contract_id": cid,
+                                             "purchase_time": c.get("purchase_time"),
+                                             "buy_price": c.get("buy_price")}})
+                break
+
+        now = time.time()
+        grace = CONFIG["settle_grace"]
+        giveup = 5 * grace
+        watch = retry = False
+        for cid, trade in list(self.open_trades.items()):
+            if cid not in self.open_trades:
+                continue        # regle par son flux pendant une ecriture
+            end = trade.signal_time + trade.expiry * 60
+            if cid in sold:
+                t = sold[cid]
+                del self.open_trades[cid]
+                self.local.pop(cid, None)
+                sell = float(t.get("sell_price", 0))
+                await self._result(trade, sell - float(t.get("buy_price", trade.stake)), sell)
+            elif cid in live:
+                if trade.provisional is not None:
+                    retry = True        # pas encore vendu cote serveur
+                elif cid not in self.local or now > end + grace:
+                    watch = True        # sans suivi local (ou flux muet)
+            elif now > end + giveup:
+                del self.open_trades[cid]
+                self.local.pop(cid, None)
+                log.warning("Contrat %s introuvable, abandonne | %s", cid, trade.symbol)
+        for trade in list(self.unconfirmed):
+            if now > trade.signal_time + trade.expiry * 60 + giveup:
+                self.unconfirmed.remove(trade)
+                log.warning("Achat sans reponse ni contrat, abandonne | %s %s",
+                            trade.symbol, trade.direction)
+        if watch and not self.watch_all:
+            self.watch_all = True
+            self._spawn(self._watch())
+        if retry:
+            self._confirm_later()
+        log.info("Bilan des contrats : %d ouverts, %d sans reponse",
+                 len(self.open_trades), len(self.unconfirmed))
+
+    async def _result(self, trade, profit, exit_price):
+        if trade.provisional is not None:
+            self.daily_profit -= trade.provisional
+            if (trade.provisional > 0) != (profit > 0):
+                log.warning("Resultat provisoire corrige | %s %s", trade.symbol, trade.direction)
         trade.is_win = profit > 0
         trade.profit = profit
-        trade.exit_price = float(poc.get("sell_price", 0))
+        trade.exit_price = exit_price
         trade.result_time = time.time()
 
-        self.stats.add(trade)
+        # Un seul thread d'ecriture : Stats et Journal ne sont pas partages
+        await asyncio.get_running_loop().run_in_executor(
+            self.stats_pool, self.stats.add, trade)
         self.daily_profit += profit
         info = CONFIG["instruments"][trade.symbol]
 
@@ -856,12 +3422,7 @@ class TradingBot:
                  f"Profit jour: {day['profit']:.2f}$ ({day['total']} trades)")
 
         if day["total"] % 10 == 0 and day["total"] > 0:
-            telegram(self.stats.format_all())
-
-        del self.open_trades[cid]
-        sub_id = data.get("subscription", {}).get("id")
-        if sub_id:
-            self.ws.send(json.dumps({"forget": sub_id}))
+            telegram(self.stats.format_all(), low=True)
 
 # ============================================================
 #                  LANCEMENT
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+FAKE DERIV - LZ TRADING BOT
+Serveur websocket local imitant la partie de l'API Deriv utilisee par le
+bot (authorize, ticks_history candles + subscribe, ohlc, ticks, proposal,
+buy, proposal_open_contract, portfolio, profit_table, forget). Rejoue des bougies M1 locales ou
+synthetiques, de 1x au plus vite possible, sans reseau.
+
+    python fake_deriv.py --data data --speed 100
+    DERIV_URL=ws://127.0.0.1:8765 python bot.py
+
+Au-dela de 1x, le bot applique toujours ses limites d'envoi en temps reel
+(CONFIG["rate_limits"]) : les achats peuvent attendre leur jeton.
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+import uuid
+import zlib
+
+import numpy as np
+import websockets
+
+from backtest import _date, _find, load_candles, resample
+from bot import CONFIG, log
+
+# ============================================================
+#                  DONNEES
+# ============================================================
+
+def synthetic(sym, start, end, seed=0):
+    # Marche aleatoire M1 reproductible par symbole
+    rnd = np.random.default_rng(zlib.crc32(sym.encode()) ^ seed)
+    t = np.arange(start // 60 * 60, end, 60, dtype=np.int64)
+    n = len(t)
+    vol = 1e-4 * (1 + zlib.crc32(sym.encode()) % 10)
+    c = 1000.0 * np.exp(np.cumsum(rnd.normal(0, vol, n)))
+    o = np.r_[1000.0, c[:-1]]
+    wick = np.abs(rnd.normal(0, vol / 2, (2, n))) * c
+    return o, np.maximum(o, c) + wick[0], np.minimum(o, c) - wick[1], c, t
+
+def _partial(o, h, l, c, frac):
+    # Bougie en cours a `frac` de sa duree : interpolation depuis
+    # l'ouverture (l <= c <= h reste vrai, frac = 1 donne la bougie finale)
+    return (o, o + (h - o) * frac, o + (l - o) * frac, o + (c - o) * frac)
+
+# ============================================================
+#                  MARCHE
+# ============================================================
+
+class Client:
+    def __init__(self, ws):
+        self.ws = ws
+        self.out = asyncio.Queue()
+        self.subs = {}          # id abonnement -> (groupe, cle) du Market
+
+    def push(self, msg):
+        self.out.put_nowait(json.dumps(msg))
+
+    async def writer(self):
+        while True:
+            await self.ws.send(await self.out.get())
+
+class Market:
+    # Horloge simulee commune : pas d'une minute, `updates` messages ohlc par
+    # bougie et par abonnement, `speed` fois le temps reel (0 = au plus vite,
+    # cadence par le client le plus lent).
+
+    def __init__(self, data=None, start=None, speed=1.0, updates=4,
+                 hours=24, seed=0):
+        self.data = data or {}      # {symbole: (o, h, l, c, t)} M1
+        self.synthetic = not data
+        self.speed = speed
+        self.updates = max(1, updates)
+        self.seed = seed
+        history = CONFIG["m15_bars"] * 900 + 900
+        if start is None:
+            if self.data:
+                start = max(d[4][0] for d in self.data.values()) + history
+            else:
+                start = int(time.time())
+        self.clock = int(start) // 900 * 900
+        self.frac = 0.0
+        self.span = (self.clock - history, self.clock + hours * 3600)
+        self.streams = {}           # (symbole, granularite) -> {id: (client, req)}
+        self.contracts = {}
+        self.expiring = []          # tas (expiration, contract_id)
+        self.watch = {}             # contract_id (None : tous) -> {id: (client, req)}
+        self.quotes = {}            # symbole -> {id proposition: (client, req)}
+        self.tickers = {}           # symbole -> {id: (client, req)}
+        self.clients = set()
+        self.ready = asyncio.Event()    # premier abonnement : debut du rejeu
+        self.balance = 10000.0
+        self._ids = itertools.count(1)
+        self.sent = 0
+
+    # ---------- bougies ----------
+
+    def series(self, sym):
+        if sym not in self.data and self.synthetic:
+            self.data[sym] = synthetic(sym, *self.span, seed=self.seed)
+        return self.data.get(sym)
+
+    def now(self):
+        return self.clock + int(60 * self.frac)
+
+    def bar(self, sym, gran):
+        # Bougie en cours (epoch, o, h, l, c) ou None si pas de M1 a l'horloge
+        o, h, l, c, t = self.data[sym]
+        i = int(np.searchsorted(t, self.clock, side="right")) - 1
+        if i < 0 or t[i] != self.clock:
+            return None
+        po, ph, pl, pc = _partial(o[i], h[i], l[i], c[i], self.frac)
+        if gran == 60:
+            return self.clock, po, ph, pl, pc
+        start = self.clock // gran * gran
+        j = int(np.searchsorted(t, start))
+        if j < i:
+            ph = max(ph, h[j:i].max())
+            pl = min(pl, l[j:i].min())
+            po = o[j]
+        return start, po, ph, pl, pc
+
+    def history(self, sym, gran, req):
+        o, h, l, c, t = self.data[sym]
+        now = self.now()
+        end = req.get("end", "latest")
+        end = now if end == "latest" else int(end)
+        start = req.get("start")
+        count = int(req.get("count", 5000))
+        if end > now:
+            # Bornes en heure reelle : ramenees a l'horloge simulee
+            if start is not None:
+                start = now - (end - int(start))
+            end = now
+        i = int(np.searchsorted(t, self.clock))
+        arrays = [x[:i] for x in (o, h, l, c, t)]
+        cur = self.bar(sym, 60)
+        if cur is not None:
+            arrays = [np.r_[x, v] for x, v in zip(arrays, cur[1:] + cur[:1])]
+        if gran != 60:
+            arrays = resample(tuple(arrays), gran)
+        o, h, l, c, t = arrays
+        sel = t <= end
+        if start is not None:
+            sel &= t >= int(start)
+        idx = np.flatnonzero(sel)[-count:]
+        return [{"epoch": int(t[k]), "open": float(o[k]), "high": float(h[k]),
+                 "low": float(l[k]), "close": float(c[k])} for k in idx]
+
+    # ---------- requetes ----------
+
+    def handle(self, client, req):
+        if "authorize" in req:
+            self._reply(client, req, "authorize", {
+                "fullname": "Fake Deriv", "loginid": "VRTC0000001",
+                "currency": "USD", "balance": round(self.balance, 2)})
+        elif "ticks_history" in req:
+            self._ticks_history(client, req)
+        elif "ticks" in req:
+            self._ticks(client, req)
+        elif "proposal" in req:
+            self._proposal(client, req)
+        elif "buy" in req:
+            self._buy(client, req)
+        elif "proposal_open_contract" in req:
+            self._poc(client, req)
+        elif "portfolio" in req:
+            self._portfolio(client, req)
+        elif "profit_table" in req:
+            self._profit_table(client, req)
+        elif "forget" in req:
+            found = self._forget(client, req["forget"])
+            self._reply(client, req, "forget", 1 if found else 0)
+        elif "time" in req:
+            self._reply(client, req, "time", self.now())
+        elif "ping" in req:
+            self._reply(client, req, "ping", "pong")
+        else:
+            self._error(client, req, "UnrecognisedRequest", "Unrecognised request.")
+
+    def _reply(self, client, req, msg_type, body, sub=None):
+        msg = {"echo_req": req, "msg_type": msg_type, msg_type: body}
+        if "req_id" in req:
+            msg["req_id"] = req["req_id"]
+        if sub:
+            msg["subscription"] = {"id": sub}
+        client.push(msg)
+        self.sent += 1
+
+    def _error(self, client, req, code, message):
+        msg = {"echo_req": req, "msg_type": next(iter(req), ""),
+               "error": {"code": code, "message": message}}
+        if "req_id" in req:
+            msg["req_id"] = req["req_id"]
+        client.push(msg)
+
+    def _ticks_history(self, client, req):
+        sym = req["ticks_history"]
+        gran = int(req.get("granularity", 60))
+        if req.get("style") != "candles":
+            return self._error(client, req, "InputValidationFailed", "Only candles are supported.")
+        if self.series(sym) is None:
+            return self._error(client, req, "InvalidSymbol", f"Symbol {sym} is invalid.")
+        sub = None
+        if req.get("subscribe"):
+            sub = uuid.uuid4().hex
+            self.streams.setdefault((sym, gran), {})[sub] = (client, req)
+            client.subs[sub] = (self.streams, (sym, gran))
+            self.ready.set()
+        self._reply(client, req, "candles", self.history(sym, gran, req), sub)
+
+    def _tick_quotes(self, sym):
+        # Ticks du pas en cours : ouverture au premier pas, puis extremes et
+        # cloture partiels. Les bougies construites depuis ces ticks sont
+        # celles des flux ohlc.
+        bar = self.bar(sym, 60)
+        if bar is None:
+            return []
+        o = self.data[sym][0][int(np.searchsorted(self.data[sym][4], self.clock))]
+        quotes = [o] if self.frac <= 1 / self.updates + 1e-9 else []
+        return quotes + list(bar[2:])
+
+    def _ticks(self, client, req):
+        sym = req["ticks"]
+        if self.series(sym) is None:
+            return self._error(client, req, "InvalidSymbol", f"Symbol {sym} is invalid.")
+        sub = None
+        if req.get("subscribe"):
+            sub = uuid.uuid4().hex
+            self.tickers.setdefault(sym, {})[sub] = (client, req)
+            client.subs[sub] = (self.tickers, sym)
+            self.ready.set()
+        bar = self.bar(sym, 60)
+        if bar is not None:
+            self._reply(client, req, "tick", {"symbol": sym, "epoch": self.now(),
+                                              "quote": bar[4], "id": sub}, sub)
+
+    def _quote(self, p, pid):
+        # Proposition au prix courant (mise = prix demande)
+        stake = float(p.get("amount", 0))
+        bar = self.bar(p["symbol"], 60)
+        return {"id": pid, "ask_price": stake, "spot": bar[4], "spot_time": self.now(),
+                "payout": round(stake * (1 + CONFIG["payout"] / 100), 2),
+                "date_start": self.now(), "longcode": f"{p['contract_type']} {p['symbol']}"}
+
+    def _proposal(self, client, req):
+        sym = req.get("symbol")
+        if req.get("contract_type") not in ("CALL", "PUT") or self.series(sym) is None:
+            return self._error(client, req, "InvalidContractProposal", "Invalid contract.")
+        if self.bar(sym, 60) is None:
+            return self._error(client, req, "MarketIsClosed", "This market is presently closed.")
+        pid = uuid.uuid4().hex
+        sub = None
+        if req.get("subscribe"):
+            sub = pid
+            self.quotes.setdefault(sym, {})[pid] = (client, req)
+            client.subs[pid] = (self.quotes, sym)
+        self._reply(client, req, "proposal", self._quote(req, pid), sub)
+
+    def _buy(self, client, req):
+        p = req.get("parameters", {})
+        if req.get("buy") != 1:
+            # Achat d'une proposition abonnee : ses parametres, puis fin du flux
+            owner = next((q for q in self.quotes.values() if req["buy"] in q), None)
+            if owner is None:
+                return self._error(client, req, "InvalidContractProposal",
+                                   "Proposal not found or expired.")
+            p = owner[req["buy"]][1]
+            self._forget(client, req["buy"])
+        sym = p.get("symbol")
+        ctype = p.get("contract_type")
+        stake = float(p.get("amount", 0))
+        if ctype not in ("CALL", "PUT") or self.series(sym) is None:
+            return self._error(client, req, "InvalidContractProposal", "Invalid contract.")
+        if float(req.get("price", 0)) < stake:
+            return self._error(client, req, "ContractBuyValidationError", "Price below stake.")
+        bar = self.bar(sym, 60)
+        if bar is None:
+            return self._error(client, req, "MarketIsClosed", "This market is presently closed.")
+        duration = int(p.get("duration", 1)) * (60 if p.get("duration_unit", "m") == "m" else 1)
+        cid = next(self._ids)
+        now = self.now()
+        self.contracts[cid] = {
+            "contract_id": cid, "underlying": sym, "contract_type": ctype,
+            "buy_price": stake, "entry_spot": bar[4], "date_start": now,
+            "date_expiry": now + duration, "is_sold": 0, "status": "open",
+            "profit": 0.0, "sell_price": 0.0, "current_spot": bar[4],
+        }
+        heapq.heappush(self.expiring, (now + duration, cid))
+        self.balance -= stake
+        self._reply(client, req, "buy", {
+            "contract_id": cid, "transaction_id": cid, "buy_price": stake,
+            "balance_after": round(self.balance, 2), "purchase_time": now,
+            "start_time": now, "longcode": f"{ctype} {sym} {duration}s"})
+
+    def _poc(self, client, req):
+        cid = req.get("contract_id")
+        if cid is None:
+            # Tous les contrats ouverts : reponse vide, puis chaque vente
+            sub = None
+            if req.get("subscribe"):
+                sub = uuid.uuid4().hex
+                self.watch.setdefault(None, {})[sub] = (client, req)
+                client.subs[sub] = (self.watch, None)
+            return self._reply(client, req, "proposal_open_contract", {}, sub)
+        contract = self.contracts.get(cid)
+        if contract is None:
+            return self._error(client, req, "InvalidContractId", "Contract not found.")
+        sub = None
+        if req.get("subscribe") and not contract["is_sold"]:
+            sub = uuid.uuid4().hex
+            self.watch.setdefault(cid, {})[sub] = (client, req)
+            client.subs[sub] = (self.watch, cid)
+        self._reply(client, req, "proposal_open_contract", dict(contract), sub)
+
+    def _portfolio(self, client, req):
+        self._reply(client, req, "portfolio", {"contracts": [
+            {"contract_id": c["contract_id"], "transaction_id": c["contract_id"],
+             "contract_type": c["contract_type"], "symbol": c["underlying"],
+             "buy_price": c["buy_price"], "purchase_time": c["date_start"],
+             "expiry_time": c["date_expiry"]}
+            for c in self.contracts.values() if not c["is_sold"]]})
+
+    def _profit_table(self, client, req):
+        since = int(req.get("date_from", 0))
+        if since > self.now():
+            since = 0       # borne en heure reelle, sans equivalent simule
+        rows = [{"contract_id": c["contract_id"], "transaction_id": c["contract_id"],
+                 "contract_type": c["contract_type"], "underlying_symbol": c["underlying"],
+                 "buy_price": c["buy_price"], "sell_price": c["sell_price"],
+                 "purchase_time": c["date_start"], "sell_time": c["sell_time"]}
+                for c in self.contracts.values()
+                if c["is_sold"] and c["date_start"] >= since]
+        rows = rows[-int(req.get("limit", 50)):]
+        self._reply(client, req, "profit_table", {"count": len(rows), "transactions": rows})
+
+    def _forget(self, client, sub):
+        entry = client.subs.pop(sub, None)
+        if entry is None:
+            return False
+        group, key = entry
+        group.get(key, {}).pop(sub, None)
+        return True
+
+    def drop(self, client):
+        for sub in list(client.subs):
+            self._forget(client, sub)
+        self.clients.discard(client)
+
+    # ---------- rejeu ----------
+
+    def _publish(self):
+        for (sym, gran), subs in self.streams.items():
+            if not subs:
+                continue
+            bar = self.bar(sym, gran)
+            if bar is None:
+                continue
+            epoch, o, h, l, c = bar
+            body = {"symbol": sym, "granularity": gran, "open_time": epoch,
+                    "epoch": self.now(), "open": str(o), "high": str(h),
+                    "low": str(l), "close": str(c)}
+            for sub, (client, req) in subs.items():
+                self._reply(client, req, "ohlc", body, sub)
+        # Epoch d'un tick : dans la minute en cours (le pas final tombe
+        # sinon sur l'ouverture de la suivante)
+        epoch = min(self.now(), self.clock + 59)
+        for sym, subs in self.tickers.items():
+            if not subs:
+                continue
+            for quote in self._tick_quotes(sym):
+                body = {"symbol": sym, "epoch": epoch, "quote": float(quote)}
+                for sub, (client, req) in subs.items():
+                    self._reply(client, req, "tick", dict(body, id=sub), sub)
+        for sym, subs in self.quotes.items():
+            if subs and self.bar(sym, 60) is not None:
+                for sub, (client, req) in subs.items():
+                    self._reply(client, req, "proposal", self._quote(req, sub), sub)
+
+    def _settle(self):
+        now = self.now()
+        while self.expiring and self.expiring[0][0] <= now:
+            _, cid = heapq.heappop(self.expiring)
+            contract = self.contracts[cid]
+            bar = self.bar(contract["underlying"], 60)
+            exit_spot = bar[4] if bar else contract["current_spot"]
+            if contract["contract_type"] == "CALL":
+                win = exit_spot > contract["entry_spot"]
+            else:
+                win = exit_spot < contract["entry_spot"]
+            stake = contract["buy_price"]
+            profit = stake * CONFIG["payout"] / 100 if win else -stake
+            contract.update(is_sold=1, status="won" if win else "lost",
+                            profit=round(profit, 2), current_spot=exit_spot,
+                            exit_tick=exit_spot, sell_time=now,
+                            sell_price=round(stake + profit, 2) if win else 0.0)
+            self.balance += contract["sell_price"]
+            for sub, (client, req) in self.watch.pop(cid, {}).items():
+                client.subs.pop(sub, None)
+                self._reply(client, req, "proposal_open_contract", dict(contract), sub)
+            for sub, (client, req) in self.watch.get(None, {}).items():
+                self._reply(client, req, "proposal_open_contract", dict(contract), sub)
+
+    async def _pace(self):
+        if self.speed > 0:
+            await asyncio.sleep(60 / self.speed / self.updates)
+            return
+        # Au plus vite, sans laisser les files d'envoi grossir
+        await asyncio.sleep(0)
+        while any(c.out.qsize() > 1000 for c in self.clients):
+            await asyncio.sleep(0.001)
+
+    async def run(self):
+        await self.ready.wait()
+        end = self.span[1] if self.synthetic else max(d[4][-1] for d in self.data.values()) + 60
+        log.info("Rejeu depuis %s (x%s)", time.strftime("%Y-%m-%d %H:%M", time.gmtime(self.clock)),
+                 self.speed or "max")
+        while self.clock < end:
+            for k in range(1, self.updates + 1):
+                self.frac = k / self.updates
+                self._publish()
+                self._settle()
+                await self._pace()
+            self.clock += 60
+            self.frac = 0.0
+        log.info("Fin des donnees")
+
+    async def report(self, every=10):
+        last, t0 = 0, time.perf_counter()
+        while True:
+            await asyncio.sleep(every)
+            t1 = time.perf_counter()
+            log.info("%s | %d clients | %d flux | %.0f msg/s | %d contrats",
+                     time.strftime("%Y-%m-%d %H:%M", time.gmtime(self.clock)),
+                     len(self.clients), sum(map(len, self.streams.values())),
+                     (self.sent - last) / (t1 - t0), len(self.contracts))
+            last, t0 = self.sent, t1
+
+# ============================================================
+#                  SERVEUR
+# ============================================================
+
+async def serve(market, host="127.0.0.1", port=8765):
+    async def handler(ws):
+        client = Client(ws)
+        market.clients.add(client)
+        writer = asyncio.create_task(client.writer())
+        try:
+            async for raw in ws:
+                try:
+                    req = json.loads(raw)
+                except ValueError:
+                    market._error(client, {}, "InputValidationFailed", "Invalid JSON.")
+                    continue
+                market.handle(client, req)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            writer.cancel()
+            market.drop(client)
+
+    async with websockets.serve(handler, host, port, max_size=None):
+        log.info("Fake Deriv sur ws://%s:%d", host, port)
+        asyncio.create_task(market.report())
+        await market.run()
+        await asyncio.Future()
+
+def main():
+    ap = argparse.ArgumentParser(description="Serveur Deriv local pour LZ Trading Bot")
+    ap.add_argument("--data", help="dossier des bougies M1 (sinon synthetiques)")
+    ap.add_argument("--symbols", default=",".join(CONFIG["instruments"]),
+                    help="symboles a charger depuis --data")
+    ap.add_argument("--start", type=_date, help="AAAA-MM-JJ")
+    ap.add_argument("--speed", type=float, default=1.0, help="x temps reel (0 = au plus vite)")
+    ap.add_argument("--updates", type=int, default=4, help="messages ohlc par bougie M1")
+    ap.add_argument("--hours", type=int, default=24, help="duree synthetique")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+
+    data = {}
+    if args.data:
+        for sym in args.symbols.split(","):
+            path = _find(args.data, sym, 60)
+            if path:
+                data[sym] = load_candles(path)
+            else:
+                log.warning("%s : pas de donnees M1 dans %s", sym, args.data)
+        if not data:
+            raise SystemExit("Aucune donnee")
+
+    logging.getLogger("websockets").setLevel(logging.WARNING)
+    market = Market(data, args.start, args.speed, args.updates, args.hours, args.seed)
+    try:
+        asyncio.run(serve(market, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+SWEEP - LZ TRADING BOT
+Balayage des reglages de strategie (grille ou tirage aleatoire) en
+backtests paralleles sur tous les coeurs.
+
+    python sweep.py --data data zz_depth=8,12,16 max_touches=5:10 use_doji=1,0
+"""
+
+import argparse
+import csv
+import itertools
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backtest import _date, load_data, prepare, run_backtest
+from bot import CONFIG, CandleSeries, Patterns, log
+
+# Reglages balayables et leur type
+KEYS = {
+    "zz_depth"    : int,
+    "zz_backstep" : int,
+    "max_touches" : int,
+    "use_doji"    : lambda v: str(v).lower() in ("1", "true", "on", "oui"),
+    "cooldown"    : int,
+    "expiry"      : int,     # applique a tous les instruments
+}
+
+# ============================================================
+#                  MEMOIRE PARTAGEE
+# ============================================================
+
+# Les bougies, leurs formes et les masques de patterns sont calcules une
+# fois dans le processus principal puis places dans un seul segment de
+# memoire partagee ; chaque worker s'y attache au lieu de recevoir une
+# copie picklee par tache.
+
+def share(prepared):
+    arrays = {}
+    for sym, d in prepared.items():
+        s = d["m1"]
+        for name, x in zip("ohlct", (s.no, s.nh, s.nl, s.nc, s.nt)):
+            arrays[(sym, "m1", name)] = x
+        for name, x in zip(("fb", "fr", "fu", "fl"), (s.fb, s.fr, s.fu, s.fl)):
+            arrays[(sym, "m1", name)] = np.asarray(x)
+        for name, x in zip("ohlct", d["m15"]):
+            arrays[(sym, "m15", name)] = np.ascontiguousarray(x)
+        for name, x in d["masks"].items():
+            arrays[(sym, "mask", name)] = x
+
+    layout = []
+    size = 0
+    for key, x in arrays.items():
+        size = (size + 7) // 8 * 8
+        layout.append((key, x.dtype.str, x.shape, size))
+        size += x.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for (key, dtype, shape, off), x in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=off)[...] = x
+    return shm, layout
+
+def attach(name, layout):
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = {key: np.ndarray(shape, dtype, buffer=shm.buf, offset=off)
+              for key, dtype, shape, off in layout}
+    prepared = {}
+    for sym in dict.fromkeys(k[0] for k in arrays):
+        m1 = [arrays[(sym, "m1", n)] for n in "ohlct"]
+        feats = [arrays[(sym, "m1", n)] for n in ("fb", "fr", "fu", "fl")]
+        prepared[sym] = {
+            "m1"   : CandleSeries(*m1, features=feats),
+            "m15"  : tuple(arrays[(sym, "m15", n)] for n in "ohlct"),
+            "masks": {n: arrays[(sym, "mask", n)]
+                      for n in Patterns.BULL + Patterns.BEAR},
+        }
+    return shm, prepared
+
+_shm = None
+_prepared = None
+
+def _init(name, layout):
+    global _shm, _prepared
+    CONFIG["telegram_enabled"] = False
+    log.setLevel(logging.WARNING)
+    _shm, _prepared = attach(name, layout)
+
+def _run(params):
+    overrides = dict(params)
+    if "expiry" in overrides:
+        expiry = overrides.pop("expiry")
+        overrides["instruments"] = {
+            s: dict(info, expiry=expiry) for s, info in CONFIG["instruments"].items()}
+    res = run_backtest(_prepared, overrides)["total"]
+    return params, res
+
+# ============================================================
+#                  ESPACE DE RECHERCHE
+# ============================================================
+
+def parse_space(specs):
+    # "cle=v1,v2" ou "cle=min:max" (entiers, bornes incluses)
+    space = {}
+    for spec in specs:
+        key, _, values = spec.partition("=")
+        if key not in KEYS:
+            raise SystemExit(f"Reglage inconnu: {key} (possibles: {', '.join(KEYS)})")
+        if ":" in values:
+            lo, hi = values.split(":")
+            vals = list(range(int(lo), int(hi) + 1))
+        else:
+            vals = [KEYS[key](v) for v in values.split(",") if v != ""]
+        space[key] = vals
+    return space
+
+def combos(space, samples=0, seed=0):
+    keys = list(space)
+    grid = [dict(zip(keys, v)) for v in itertools.product(*space.values())]
+    if samples and samples < len(grid):
+        grid = random.Random(seed).sample(grid, samples)
+    return grid
+
+def sweep(prepared, grid, workers=None):
+    shm, layout = share(prepared)
+    try:
+        workers = workers or os.cpu_count() or 1
+        chunk = max(1, len(grid) // (workers * 4))
+        with ProcessPoolExecutor(workers, initializer=_init,
+                                 initargs=(shm.name, layout)) as pool:
+            results = list(pool.map(_run, grid, chunksize=chunk))
+    finally:
+        shm.close()
+        shm.unlink()
+    results.sort(key=lambda r: r[1]["profit"], reverse=True)
+    return results
+
+# ============================================================
+#                  LANCEMENT
+# ============================================================
+
+def main():
+    ap = argparse.ArgumentParser(description="Balayage de reglages LZ Trading Bot")
+    ap.add_argument("space", nargs="+", help="cle=v1,v2 ou cle=min:max")
+    ap.add_argument("--data", default="data", help="dossier des bougies")
+    ap.add_argument("--start", type=_date, default=0, help="AAAA-MM-JJ")
+    ap.add_argument("--end", type=_date, default=2**62, help="AAAA-MM-JJ")
+    ap.add_argument("--random", type=int, default=0, help="nombre de tirages (0 = grille)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=0)
+    ap.add_argument("--out", default="sweep_results.csv")
+    ap.add_argument("--top", type=int, default=20)
+    args = ap.parse_args()
+
+    space = parse_space(args.space)
+    grid = combos(space, args.random, args.seed)
+    CONFIG["telegram_enabled"] = False
+
+    t0 = time.perf_counter()
+    prepared = prepare(load_data(args.data, list(CONFIG["instruments"]),
+                                 args.start, args.end))
+    log.info("%d combinaisons | donnees pretes en %.1fs", len(grid), time.perf_counter() - t0)
+    results = sweep(prepared, grid, args.workers)
+    log.info("Balayage termine en %.1fs", time.perf_counter() - t0)
+
+    keys = list(space)
+    with open(args.out, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["rang"] + keys + ["trades", "winrate", "profit", "max_l", "max_w"])
+        for rank, (params, s) in enumerate(results, 1):
+            w.writerow([rank] + [params[k] for k in keys] +
+                       [s["total"], f"{s['winrate']:.2f}", f"{s['profit']:.2f}",
+                        s["max_l"], s["max_w"]])
+
+    for rank, (params, s) in enumerate(results[:args.top], 1):
+        desc = " ".join(f"{k}={params[k]}" for k in keys)
+        log.info("#%d %s | %d trades | WR %.1f%% | %.2f$ | MaxL %d",
+                 rank, desc, s["total"], s["winrate"], s["profit"], s["max_l"])
+    log.info("Resultats: %s", args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import os
+import sys
+
+# Modules du bot a la racine du depot (pas de package installe)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from bot import CONFIG, Stats, TradingBot
+
+
+class Bot(TradingBot):
+    # Zones calculees sur place, comme en backtest
+    ZONE_THREADS = False
+
+
+class Conn:
+    # Connexion factice : messages envoyes gardes dans l'ordre ; request()
+    # repond par reply(msg) (reponse ou exception, {} par defaut)
+    def __init__(self):
+        self.sent = []
+        self.reply = lambda msg: {}
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+    async def request(self, msg, timeout=None):
+        self.sent.append(msg)
+        res = self.reply(msg)
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+
+@pytest.fixture
+def make_bot(monkeypatch):
+    # Bot sans fichiers (cache, zones, enregistrement, stats) ni socket,
+    # construit apres les reglages propres au test
+    for key in ("cache_dir", "zone_file", "record_dir"):
+        monkeypatch.setitem(CONFIG, key, "")
+
+    def make():
+        b = Bot(Stats(None))
+        b.conn = Conn()
+        return b
+    return make
+
+
+@pytest.fixture
+def bot(make_bot):
+    return make_bot()
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from bot import CONFIG, Connection, TokenBucket
+
+
+class WS:
+    def __init__(self):
+        self.sent = []      # (heure, message)
+
+    async def send(self, text):
+        self.sent.append((time.monotonic(), json.loads(text)))
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(60, 2)         # 1 jeton par seconde
+    now = bucket.stamp
+    for _ in range(2):
+        assert bucket.delay(now) == 0.0
+        bucket.tokens -= 1
+    assert bucket.delay(now) == pytest.approx(1.0)
+    assert bucket.delay(now + 0.5) == pytest.approx(0.5)
+    assert bucket.delay(now + 1.0) == 0.0
+    assert bucket.delay(now + 100) == 0.0 and bucket.tokens == 2
+
+
+def test_priority_order_and_throttling(monkeypatch):
+    # history limite a 10/s apres 2 envois ; les autres classes ont de la
+    # reserve. Un achat arrive pendant l'attente d'un jeton history.
+    monkeypatch.setitem(CONFIG, "rate_limits", {
+        "buy": (600, 10), "contract": (600, 10),
+        "forget": (600, 10), "history": (600, 2)})
+
+    async def run():
+        ws = WS()
+        conn = Connection(ws)
+        for i in range(6):
+            conn.send({"ticks_history": f"H{i}"})
+        for i in range(2):
+            conn.send({"forget": f"F{i}"})
+            conn.send({"proposal": 1, "n": i})
+            conn.send({"buy": i})
+        conn.send({"time": 1})
+        await asyncio.sleep(0.15)      # entre H2 (0.1 s) et H3 (0.2 s)
+        late = time.monotonic()
+        conn.send({"buy": "late"})
+        await conn.flusher
+        return ws.sent, late
+
+    sent, late = asyncio.run(run())
+    order = [next(iter(m.values())) for _, m in sent]
+    assert order[:9] == [1, 0, 1, 1, 1, "F0", "F1", "H0", "H1"]
+    # Achat tardif envoye des son arrivee, avant les history en attente
+    assert order[9:] == ["H2", "late", "H3", "H4", "H5"]
+    assert sent[10][0] - late < 0.04
+
+    stamps = [t for t, m in sent if "ticks_history" in m]
+    gaps = [b - a for a, b in zip(stamps[1:], stamps[2:])]
+    assert all(g >= 0.09 for g in gaps), gaps
@@ -0,0 +1,70 @@
+import asyncio
+import random
+
+from bot import Inbox
+
+
+def _flood(seed, n):
+    # Mises a jour ohlc (plusieurs versions par bougie, plusieurs flux)
+    # melangees a des achats et des resultats de contrats
+    rnd = random.Random(seed)
+    bars = {(sym, gran): [0, 0] for sym in ("R_10", "R_25") for gran in (60, 900)}
+    out = []
+    for i in range(n):
+        r = rnd.random()
+        if r < 0.08:
+            out.append({"msg_type": "buy", "n": i, "buy": {"contract_id": i}})
+        elif r < 0.16:
+            out.append({"msg_type": "proposal_open_contract", "n": i,
+                        "proposal_open_contract": {"contract_id": i}})
+        else:
+            key = rnd.choice(list(bars))
+            bar = bars[key]
+            if rnd.random() < 0.2:
+                bar[0] += key[1]        # bougie suivante
+                bar[1] = 0
+            bar[1] += 1
+            out.append({"msg_type": "ohlc", "n": i, "ohlc": {
+                "symbol": key[0], "granularity": key[1],
+                "open_time": bar[0], "version": bar[1]}})
+    return out
+
+
+def test_coalescing_loses_no_bar_and_no_other_message():
+    sent = _flood(0, 5000)
+
+    async def run():
+        inbox = Inbox(16)
+        got = []
+        rnd = random.Random(1)
+
+        async def consume():
+            # Plus lent que la lecture : la file se remplit et fusionne
+            while True:
+                got.append(await inbox.get())
+                for _ in range(rnd.randrange(3)):
+                    await asyncio.sleep(0)
+
+        consumer = asyncio.create_task(consume())
+        for msg in sent:
+            await inbox.put(msg)
+        while len(inbox):
+            await asyncio.sleep(0)
+        consumer.cancel()
+        return got
+
+    got = asyncio.run(run())
+
+    others = [m for m in sent if m["msg_type"] != "ohlc"]
+    assert [m for m in got if m["msg_type"] != "ohlc"] == others
+
+    # Version finale de chaque bougie recue, dans l'ordre d'arrivee
+    final = {}
+    for m in sent:
+        if m["msg_type"] == "ohlc":
+            o = m["ohlc"]
+            final[(o["symbol"], o["granularity"], o["open_time"])] = m
+    ohlc = [m for m in got if m["msg_type"] == "ohlc"]
+    assert all(m in ohlc for m in final.values())
+    assert [m["n"] for m in got] == sorted(m["n"] for m in got)
+    assert len(ohlc) < len(sent) - len(others)     # fusion effective
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+from bot import CONFIG, Stats, Trade
+
+
+def test_concurrent_add_keeps_every_record(tmp_path, monkeypatch):
+    # Ecritures depuis plusieurs threads, compactions comprises
+    monkeypatch.setitem(CONFIG, "journal_compact", 50)
+    stats = Stats(str(tmp_path / "stats.jsonl"))
+
+    def writer(k):
+        for i in range(200):
+            t = Trade(1700000000 + k * 1000 + i, "CALL", "R_10", 1.0, 1.0, 5)
+            t.is_win = i % 2 == 0
+            stats.add(t)
+
+    threads = [threading.Thread(target=writer, args=(k,)) for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats.journal.sync()
+
+    records = stats.journal.read()
+    assert len(records) == 800
+    assert sorted(r["seq"] for r in records) == list(range(1, 801))
+
+
+def _fill(stats, first, n, step=3600):
+    for i in range(n):
+        t = Trade(first + i * step, "CALL", ("R_10", "R_25")[i % 2], 1.0, 1.0, 5)
+        t.is_win = (i * 7) % 3 != 0
+        stats.add(t)
+    stats.journal.sync()
+
+
+def _full(path):
+    # Relecture complete, sans le fichier des totaux
+    stats = Stats(path)
+    if os.path.exists(stats.journal.totals_path):
+        os.remove(stats.journal.totals_path)
+    stats.load()
+    return stats
+
+
+def _totals(stats):
+    return {k: v.state() for k, v in stats.aggs.items() if k[0] == "total"}
+
+
+def test_tail_load_keeps_totals(tmp_path, monkeypatch):
+    # Chargement partiel : total identique a une relecture complete
+    monkeypatch.setitem(CONFIG, "journal_compact", 100)
+    path = str(tmp_path / "stats.jsonl")
+    _fill(Stats(path), 1700000000, 400)
+    since = 1700000000 + 300 * 3600
+
+    full = _full(path)
+    os.remove(full.journal.totals_path)
+    for _ in range(2):      # sans puis avec le fichier des totaux
+        tail = Stats(path)
+        tail.load(since)
+        assert _totals(tail) == _totals(full)
+        assert len(tail.results) == 100
+
+    _fill(tail, 1700000000 + 400 * 3600, 50)
+    tail = Stats(path)
+    tail.load(since)
+    full = _full(path)
+    assert _totals(tail) == _totals(full)
+    assert len(tail.results) == 150
+
+
+def test_idle_journal_is_synced_by_timer(tmp_path, monkeypatch):
+    monkeypatch.setitem(CONFIG, "journal_sync_every", 100)
+    monkeypatch.setitem(CONFIG, "journal_sync_secs", 0.05)
+    stats = Stats(str(tmp_path / "stats.jsonl"))
+    journal = stats.journal
+    journal.last_sync = time.time()
+    stats.add(Trade(1700000000, "PUT", "R_10", 1.0, 1.0, 5))
+    assert journal.unsynced == 1 and journal.timer is not None
+    time.sleep(0.3)
+    assert journal.unsynced == 0 and journal.timer is None
+
+
+def test_compaction_appends_and_writes_totals(tmp_path, monkeypatch):
+    # Snapshot complete (pas reecrit), totaux a jour a chaque compaction
+    monkeypatch.setitem(CONFIG, "journal_compact", 50)
+    path = str(tmp_path / "stats.jsonl")
+    stats = Stats(path)
+    stats.load()
+    _fill(stats, 1700000000, 120)
+    journal = stats.journal
+    with open(journal.snap_path, "rb") as f:
+        before = f.read()
+    assert journal.load_totals()[0] == 100
+    _fill(stats, 1700000000 + 120 * 3600, 40)
+    with open(journal.snap_path, "rb") as f:
+        after = f.read()
+    assert after.startswith(before) and len(after) > len(before)
+
+    seq, _ = journal.load_totals()
+    assert seq == 150
+    tail = Stats(path)
+    tail.load(1700000000 + 150 * 3600)
+    assert _totals(tail) == _totals(_full(path))
+
+
+def test_compaction_after_crash_mid_append(tmp_path, monkeypatch):
+    # Ligne du snapshot coupee par un crash, journal pas encore vide :
+    # la compaction suivante reprend apres la derniere ligne entiere
+    monkeypatch.setitem(CONFIG, "journal_compact", 1000)
+    path = str(tmp_path / "stats.jsonl")
+    stats = Stats(path)
+    _fill(stats, 1700000000, 30)
+    stats.journal.compact()
+    _fill(stats, 1700000000 + 30 * 3600, 20)
+    with open(stats.journal.path, "rb") as f:
+        first_new = f.readline()
+    with open(stats.journal.snap_path, "ab") as f:
+        f.write(first_new[:len(first_new) // 2])
+    stats.journal.compact()
+
+    records = Stats(path).journal.read()
+    assert [r["seq"] for r in records] == list(range(1, 51))
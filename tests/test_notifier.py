@@ -0,0 +1,20 @@
+from bot import Notifier
+
+
+def _queued(notifier):
+    return [text for text, _ in notifier.queue]
+
+
+def test_full_queue_drops_only_reports(monkeypatch):
+    # Pas de thread d'envoi : la file reste telle quelle
+    monkeypatch.setattr(Notifier, "_worker", lambda self: None)
+    n = Notifier(3)
+    for text in ("signal 1", "rapport", "signal 2"):
+        n.send(text, low=text == "rapport")
+    n.send("signal 3")
+    assert _queued(n) == ["signal 1", "signal 2", "signal 3"]
+
+    n.send("rapport 2", low=True)       # plein, sans rapport a remplacer
+    n.send("resultat")
+    assert _queued(n) == ["signal 1", "signal 2", "signal 3", "resultat"]
+    assert n.dropped == 2
@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import pytest
+
+from bot import CONFIG, Stats, Trade
+
+
+@pytest.mark.parametrize("server_win", (True, False))
+def test_provisional_result_then_server_result(make_bot, monkeypatch, tmp_path, server_win):
+    # Resultat local WIN (sortie au-dessus de l'entree), puis resultat
+    # officiel : identique ou contraire (correction)
+    monkeypatch.setitem(CONFIG, "local_settle", True)
+    monkeypatch.setitem(CONFIG, "settle_confirm", 3600)
+    bot = make_bot()
+    bot.stats = Stats(str(tmp_path / "stats.jsonl"))
+    sym = bot.symbols[0]
+    start = int(time.time())
+    trade = Trade(start - 1, "CALL", sym, 100.0, 1.0, 1)
+    sell = 1.95 if server_win else 0.0
+
+    def reply(msg):
+        if "portfolio" in msg:
+            return {"portfolio": {"contracts": []}}
+        if "profit_table" in msg:
+            return {"profit_table": {"transactions": [
+                {"contract_id": 7, "buy_price": 1.0, "sell_price": sell}]}}
+        return {}
+    bot.conn.reply = reply
+
+    async def run():
+        bot._bought(trade, {"buy": {"contract_id": 7, "start_time": start,
+                                    "buy_price": 1.0, "payout": 1.95}})
+        bot._spot(sym, start + 1, 100.0)        # entree
+        bot._spot(sym, start + 30, 100.5)
+        bot._spot(sym, start + 60, 101.0)       # expiration
+        assert trade.provisional == pytest.approx(0.95)
+        assert bot.daily_profit == pytest.approx(0.95)
+        assert bot.stats.total()["total"] == 0  # rien d'ecrit avant l'officiel
+        assert bot.confirm is not None
+        bot.confirm.cancel()
+        bot._confirm()                          # bilan groupe
+        await asyncio.gather(*bot.tasks)
+    asyncio.run(run())
+
+    profit = sell - 1.0
+    assert bot.open_trades == {} and bot.local == {}
+    assert bot.daily_profit == pytest.approx(profit)
+    total = bot.stats.total()
+    assert (total["wins"], total["losses"]) == ((1, 0) if server_win else (0, 1))
+    bot.stats.journal.sync()
+    records = bot.stats.journal.read()
+    assert len(records) == 1
+    assert records[0]["contract_id"] == 7
+    assert records[0]["win"] is server_win
+    assert records[0]["profit"] == pytest.approx(profit)
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from bot import CONFIG, ApiError, Trade
+
+
+def test_gated_signal_releases_the_armed_proposal(bot, monkeypatch):
+    # Plafond journalier atteint : la proposition pre-abonnee est oubliee
+    monkeypatch.setitem(CONFIG, "prearm", True)
+    bot.authorized = True
+    sym = bot.symbols[0]
+    bot.m1_ok[sym] = bot.m15_ok[sym] = True
+    bot.armed[sym] = {"dir": "CALL", "id": "p1", "sub": "s1", "time": 0.0}
+    bot.daily_trades = CONFIG["max_trades_per_day"]
+
+    bot._check_signal(sym)
+    assert sym not in bot.armed
+    assert bot.conn.sent == [{"forget": "s1"}]
+
+
+def test_refused_proposal_falls_back_and_rearms(bot, monkeypatch):
+    # Achat par proposition refuse, achat direct accepte : le flux de la
+    # proposition est oublie et le symbole rearme
+    monkeypatch.setitem(CONFIG, "prearm", True)
+    bot.authorized = True
+    sym = bot.symbols[0]
+    bot.armed[sym] = {"dir": "CALL", "id": "p1", "sub": "s1", "time": time.time()}
+
+    def reply(msg):
+        if msg.get("buy") == "p1":
+            return ApiError({"error": {"message": "proposition expiree"}})
+        if msg.get("buy") == 1:
+            return {"buy": {"contract_id": 7, "buy_price": 1.0}}
+        if "proposal" in msg:
+            return {"proposal": {"id": "p2"}, "subscription": {"id": "s2"}}
+        return {}
+    bot.conn.reply = reply
+    trade = Trade(time.time(), "CALL", sym, 1.0, 1.0, 5)
+    bot.pending_trades.add(trade)
+
+    async def run():
+        await bot._buy(trade)
+        for _ in range(5):
+            await asyncio.sleep(0)
+    asyncio.run(run())
+
+    assert {"forget": "s1"} in bot.conn.sent
+    assert bot.open_trades == {7: trade}
+    assert bot.armed[sym]["dir"] == "CALL"
+    assert bot.armed[sym]["sub"] == "s2"
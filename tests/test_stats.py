@@ -0,0 +1,24 @@
+import random
+import time
+
+import pytest
+
+from bot import Stats, Trade, period_start
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_aggregates_match_calc(seed):
+    # Agregats par periode = calc() depuis le debut de la periode
+    rnd = random.Random(seed)
+    now = time.time()
+    stats = Stats(None)
+    for t in sorted(rnd.uniform(now - 40 * 86400, now) for _ in range(500)):
+        trade = Trade(t, "CALL", rnd.choice(("R_10", "R_25")), 1.0, 1.0, 5)
+        trade.is_win = rnd.random() < 0.5
+        stats.add(trade)
+
+    for symbol in (None, "R_10", "R_25"):
+        for period, fn in (("day", stats.today), ("week", stats.week),
+                           ("month", stats.month), ("total", stats.total)):
+            start = period_start(period, now) if period != "total" else 0
+            assert fn(symbol) == pytest.approx(stats.calc(start, symbol)), (period, symbol)
@@ -0,0 +1,47 @@
+import asyncio
+
+from bot import CONFIG, Candle
+
+
+def _bar(t):
+    return Candle(1.0, 1.2, 0.8, 1.1, t)
+
+
+def _reply(sym, gran, first, end):
+    candles = [{"open": 1.0, "high": 1.2, "low": 0.8, "close": 1.1, "epoch": t}
+               for t in range(first, end + 1, gran)]
+    return {"msg_type": "candles", "candles": candles,
+            "echo_req": {"ticks_history": sym, "granularity": gran}}
+
+
+def test_tick_before_history_keeps_the_gap(bot, monkeypatch):
+    # Reconnexion : le tick precede la reponse ticks_history ; la bougie
+    # des ticks ne doit ni masquer le trou ni passer avant l'historique
+    monkeypatch.setitem(CONFIG, "tick_bars", True)
+    sym = bot.symbols[0]
+    stale = 1700000000 - 1700000000 % 900      # derniere bougie du cache
+    for i in range(100):
+        bot.m1[sym].append(_bar(stale - (99 - i) * 60))
+        bot.m15[sym].append(_bar(stale - (99 - i) * 900))
+    bot.m1_ok[sym] = bot.m15_ok[sym] = True
+
+    bot._on_close(1006)
+    assert not bot.m1_ok[sym] and not bot.m15_ok[sym]
+    end = stale + 4 * 900 + 120
+    bot._auth({"authorize": {"fullname": "test", "balance": 0}}, end)
+    for epoch in (end + 5, end + 65):       # la M1 de end se cloture
+        bot._tick({"tick": {"symbol": sym, "epoch": epoch, "quote": 1.05}})
+    assert bot.m1[sym][-1].time == stale
+
+    async def replies():
+        await bot._hist(_reply(sym, 900, stale, end - end % 900))
+        await bot._hist(_reply(sym, 60, stale, end))
+    asyncio.run(replies())
+
+    for gran, buf in ((60, bot.m1[sym]), (900, bot.m15[sym])):
+        times = [c.time for c in buf]
+        assert times == list(range(times[0], times[-1] + 1, gran))
+    assert bot.m1[sym][-1].time == end + 60
+    assert bot.m1[sym][-2].open == 1.0      # ouverture de l'historique
+    assert bot.m1[sym][-2].close == 1.05    # cloture des ticks
+    assert bot.m1_ok[sym] and bot.m15_ok[sym]